@@ -0,0 +1,80 @@
+"""
+Embedding backend benchmark.
+
+Reports texts/sec for document (chunk-sized) and query embedding on each
+backend, plus recall@k drift of every backend against the float "torch"
+reference, so a quantized backend can be checked before switching to it.
+
+    python -m benchmarks.bench_embeddings --backends torch onnx onnx-int8 --threads 4
+    python -m benchmarks.bench_embeddings --corpus docs/handbook.txt --k 5
+"""
+import argparse
+import random
+import time
+
+from utils.embeddings import EMBEDDING_BACKENDS, create_embedding_function, measure_throughput, recall_drift
+from utils.rag import iter_chunks
+
+SUBJECTS = ["the invoice", "a customer", "the warehouse", "our support team", "the quarterly report",
+            "the server", "a new employee", "the contract", "the shipment", "the marketing plan"]
+VERBS = ["must be approved by", "is reviewed with", "depends on", "is delayed because of", "was updated after",
+         "is stored next to", "should be sent to", "is escalated to", "was rejected by", "is scheduled with"]
+OBJECTS = ["the finance department", "the regional manager", "a safety inspection", "the legal team",
+           "the backup schedule", "the annual budget", "a late payment", "the onboarding checklist",
+           "the delivery partner", "the product launch"]
+
+def synthetic_corpus(n_docs: int, seed: int = 0):
+    """
+    Builds deterministic short passages and queries drawn from them.
+    """
+    rng = random.Random(seed)
+
+    def sentence():
+        return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)}."
+
+    corpus = [" ".join(sentence() for _ in range(rng.randint(3, 8))) for _ in range(n_docs)]
+    queries = [f"why {rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)}?" for _ in range(max(10, n_docs // 10))]
+    return corpus, queries
+
+def corpus_from_file(path: str, n_queries: int = 50, seed: int = 0):
+    """
+    Chunks a text file with RAGEngine's chunker (content-defined, at most
+    400 words, 50 overlap); queries are the opening words of random chunks.
+    """
+    with open(path, encoding="utf-8") as f:
+        corpus = list(iter_chunks(f))
+    rng = random.Random(seed)
+    queries = [" ".join(rng.choice(corpus).split()[:12]) for _ in range(n_queries)]
+    return corpus, queries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--docs", type=int, default=500)
+    parser.add_argument("--corpus", help="Text file to chunk instead of the synthetic corpus")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=5)
+    args = parser.parse_args()
+
+    corpus, queries = corpus_from_file(args.corpus) if args.corpus else synthetic_corpus(args.docs)
+    backends = {
+        name: create_embedding_function(name, threads=args.threads, batch_size=args.batch_size)
+        for name in args.backends
+    }
+    reference = backends.get("torch") or create_embedding_function("torch")
+
+    print(f"{len(corpus)} passages, {len(queries)} queries, threads={args.threads}, batch_size={args.batch_size}")
+    print(f"{'backend':<10} {'docs/sec':>10} {'queries/sec':>12} {'recall@' + str(args.k):>10} {'cosine':>8}")
+    for name, embedding_fn in backends.items():
+        docs_rate = measure_throughput(embedding_fn, corpus)
+        # Queries arrive one at a time in the app
+        started = time.perf_counter()
+        for query in queries:
+            embedding_fn([query])
+        query_rate = len(queries) / (time.perf_counter() - started)
+        drift = recall_drift(reference, embedding_fn, corpus, queries, args.k)
+        print(f"{name:<10} {docs_rate:>10.1f} {query_rate:>12.1f} {drift['recall_at_k']:>10.3f} {drift['mean_cosine']:>8.4f}")
+
+if __name__ == "__main__":
+    main()
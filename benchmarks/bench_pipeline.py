@@ -0,0 +1,448 @@
+"""
+End-to-end pipeline benchmark, fully offline.
+
+Runs the real RAGEngine and STTEngine on synthetic documents and audio.
+Gemini is replaced by utils.fake_llm.FakeGenerativeModel and Edge TTS / gTTS
+by utils.fake_tts.FakeAudioStreamer, both with fixed seeded latencies, so
+runs are repeatable and only local work changes between versions.
+
+Stages (pick with --stages):
+  ingest     chunks/sec and words/sec indexing a fresh document, and the
+             time to re-index the same text in another namespace (embedding reuse)
+  retrieval  retrieve() latency on cold and repeated queries per corpus size
+  stt        Whisper real-time factor on synthetic clips (or --audio-dir files)
+  turns      full turn latency through utils.pipeline.Pipeline (optional STT,
+             retrieval, streamed LLM answer, pipelined TTS) with N
+             concurrent simulated sessions
+
+Results are written as JSON together with the tracer's per-stage
+percentiles; --baseline compares the run with an earlier result file.
+
+    python -m benchmarks.bench_pipeline --output benchmarks/results/main.json
+    python -m benchmarks.bench_pipeline --stages retrieval turns --baseline benchmarks/results/main.json
+    python -m benchmarks.bench_pipeline --compare old.json new.json --threshold 0.1
+"""
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+import wave
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from benchmarks.bench_embeddings import OBJECTS, SUBJECTS, VERBS
+from utils.answer_cache import SemanticAnswerCache
+from utils.fake_llm import FakeGenerativeModel
+from utils.fake_tts import FakeAudioStreamer
+from utils.lazy import ComponentRegistry
+from utils.llm import GeminiLLM
+from utils.pipeline import Pipeline
+from utils.rag import RAGEngine, iter_chunks
+from utils.tracing import tracer
+
+STAGES = ("ingest", "retrieval", "stt", "turns")
+SAMPLE_RATE = 16000
+FAKE_REPLY = ("The invoice must be approved by the finance department before the end of the month. "
+              "After approval it is sent to the regional manager, who schedules the payment. "
+              "Late payments are escalated to the legal team, and the quarterly report lists every exception.")
+
+def _percentiles_ms(seconds: List[float]) -> Dict[str, Optional[float]]:
+    if not seconds:
+        return {"p50_ms": None, "p95_ms": None, "mean_ms": None}
+    ms = np.asarray(seconds) * 1000
+    return {
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "mean_ms": float(ms.mean()),
+    }
+
+# --- Synthetic inputs ---
+
+def synthetic_document(n_words: int, seed: int) -> str:
+    """
+    Deterministic prose built from the bench_embeddings vocabulary, so the
+    benchmark questions have real matches in it.
+    """
+    rng = random.Random(seed)
+    sentences, words = [], 0
+    while words < n_words:
+        sentence = f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)} (case {rng.randrange(100000)})."
+        sentences.append(sentence[0].upper() + sentence[1:])
+        words += len(sentence.split())
+    return " ".join(sentences)
+
+def document_for_chunks(n_chunks: int, seed: int, chunk_size: int = 400, overlap: int = 50) -> str:
+    """
+    Synthetic document that RAGEngine.split_text cuts into exactly n_chunks
+    chunks: the chunker's cut points depend on the words, so the text is
+    generated long enough and trimmed after the n_chunks-th chunk.
+    """
+    chunks = list(itertools.islice(
+        iter_chunks([synthetic_document(n_chunks * chunk_size, seed)], chunk_size, overlap), n_chunks))
+    # Every chunk after the first starts with the previous chunk's last overlap words
+    return " ".join([chunks[0]] + [" ".join(chunk.split()[overlap:]) for chunk in chunks[1:]])
+
+def synthetic_questions(n: int, seed: int) -> List[str]:
+    """
+    Distinct questions, so none of them hits the retrieval caches.
+    """
+    combos = [(s, v, o) for s in SUBJECTS for v in VERBS for o in OBJECTS]
+    picked = random.Random(seed).sample(combos, min(n, len(combos)))
+    return [f"Why {s} {v} {o}?" for s, v, o in picked]
+
+def synthetic_speech(seconds: float, seed: int) -> np.ndarray:
+    """
+    Speech-like 16 kHz float32 audio: a harmonic voice with a wandering
+    pitch, syllable-rate amplitude envelope, short pauses and background noise.
+    """
+    rng = np.random.default_rng(seed)
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n) / SAMPLE_RATE
+    pitch = 160 + 40 * np.sin(2 * np.pi * 0.5 * t + rng.uniform(0, 2 * np.pi))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 8))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t + rng.uniform(0, 2 * np.pi)), 0, None) ** 2
+    # Every quarter second is silent with probability 0.2
+    gate = np.repeat(rng.random(n // (SAMPLE_RATE // 4) + 1) > 0.2, SAMPLE_RATE // 4)[:n]
+    signal = voice * syllables * gate + rng.normal(0, 0.02, n)
+    return (0.5 * signal / np.abs(signal).max()).astype(np.float32)
+
+def wav_bytes(samples: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+def load_clips(args) -> List[Tuple[str, bytes, Optional[np.ndarray]]]:
+    """
+    (name, file bytes, samples) per clip; samples is None for --audio-dir files.
+    """
+    if args.audio_dir:
+        clips = []
+        for name in sorted(os.listdir(args.audio_dir)):
+            with open(os.path.join(args.audio_dir, name), "rb") as f:
+                clips.append((name, f.read(), None))
+        return clips
+    clips = []
+    for i, seconds in enumerate(args.clip_seconds):
+        samples = synthetic_speech(seconds, seed=i)
+        clips.append((f"synthetic_{seconds:g}s", wav_bytes(samples), samples))
+    return clips
+
+# --- Stages ---
+
+def bench_ingest(engine: RAGEngine, args) -> Dict[str, Any]:
+    text = synthetic_document(args.ingest_words, seed=args.seed)
+    chunks = len(engine.split_text(text))
+    started = time.perf_counter()
+    embedded = engine.index_document(text, "ingest.txt", namespace="bench-ingest")
+    seconds = time.perf_counter() - started
+
+    # Same text in another namespace: every embedding is reused
+    started = time.perf_counter()
+    engine.index_document(text, "ingest.txt", namespace="bench-ingest-reuse")
+    reuse_seconds = time.perf_counter() - started
+    for namespace in ("bench-ingest", "bench-ingest-reuse"):
+        engine.drop_namespace(namespace)
+
+    print(f"ingest     : {chunks} chunks in {seconds:.2f}s ({chunks / seconds:.1f} chunks/sec), "
+          f"re-index with reuse {reuse_seconds:.2f}s")
+    return {
+        "words": args.ingest_words,
+        "chunks": chunks,
+        "embedded": embedded,
+        "seconds": seconds,
+        "chunks_per_sec": chunks / seconds,
+        "words_per_sec": args.ingest_words / seconds,
+        "reuse_seconds": reuse_seconds,
+    }
+
+def bench_retrieval(engine: RAGEngine, args) -> Dict[str, Any]:
+    questions = synthetic_questions(len(args.corpus_chunks) * args.queries, seed=args.seed)
+    results = {}
+    for i, n_chunks in enumerate(args.corpus_chunks):
+        namespace = f"bench-corpus-{n_chunks}"
+        engine.index_document(document_for_chunks(n_chunks, seed=args.seed + n_chunks),
+                              f"corpus_{n_chunks}.txt", namespace=namespace)
+        cold, cached = [], []
+        for question in questions[i * args.queries:(i + 1) * args.queries]:
+            started = time.perf_counter()
+            engine.retrieve(question, namespace=namespace)
+            cold.append(time.perf_counter() - started)
+        for question in questions[i * args.queries:(i + 1) * args.queries]:
+            started = time.perf_counter()
+            engine.retrieve(question, namespace=namespace)
+            cached.append(time.perf_counter() - started)
+        engine.drop_namespace(namespace)
+
+        result = _percentiles_ms(cold)
+        result.update({f"cached_{k}": v for k, v in _percentiles_ms(cached).items()})
+        results[str(n_chunks)] = result
+        print(f"retrieval  : {n_chunks:>6} chunks  p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  "
+              f"cached p50 {result['cached_p50_ms']:6.2f} ms")
+    return results
+
+def bench_stt(args) -> Dict[str, Any]:
+    from utils.stt import STTEngine
+
+    engine = STTEngine(model_size=args.stt_model, cpu_threads=args.stt_threads)
+    clips = load_clips(args)
+    # One untimed pass so model start-up isn't counted against the first clip
+    engine.transcribe(clips[0][1])
+
+    rows, factors = [], []
+    for name, data, samples in clips:
+        started = time.perf_counter()
+        if samples is not None:
+            # Synthetic audio is decoded in full; the VAD in transcribe() would drop most of it
+            engine.transcribe_samples(samples)
+            duration = len(samples) / SAMPLE_RATE
+        else:
+            _, duration = engine.transcribe_with_info(data)
+        seconds = time.perf_counter() - started
+        rtf = seconds / duration if duration else 0.0
+        factors.append(rtf)
+        rows.append({"clip": name, "audio_seconds": duration, "seconds": seconds, "real_time_factor": rtf})
+        print(f"stt        : {name:<20} {duration:5.1f}s audio  RTF {rtf:.3f}")
+    return {
+        "model": args.stt_model,
+        "clips": rows,
+        "mean_real_time_factor": float(np.mean(factors)),
+        "max_real_time_factor": float(np.max(factors)),
+    }
+
+async def _session(session_id: int, pipeline: Pipeline, clip: Optional[bytes], questions: List[str],
+                   voice_share: float, seed: int) -> List[Dict[str, float]]:
+    """
+    One simulated user asking questions back to back through Pipeline.answer.
+    """
+    rng = random.Random(seed + session_id)
+    turns = []
+    for question in questions:
+        voice = clip is not None and rng.random() < voice_share
+        timings = {}
+        started = time.perf_counter()
+        if voice:
+            # The synthetic clip has no words; the scripted question stands in for its transcript
+            await asyncio.to_thread(pipeline.transcribe, clip)
+        async for event in pipeline.answer(question, "bench-turns", is_audio=voice):
+            if event["type"] == "text":
+                timings.setdefault("first_token", time.perf_counter() - started)
+            elif event["type"] == "audio":
+                timings.setdefault("first_audio", time.perf_counter() - started)
+        timings["total"] = time.perf_counter() - started
+        turns.append(timings)
+    return turns
+
+async def _run_sessions(n_sessions: int, questions: List[str], **kwargs) -> Tuple[List[Dict[str, float]], float]:
+    per_session = len(questions) // n_sessions
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        _session(i, questions=questions[i * per_session:(i + 1) * per_session], **kwargs)
+        for i in range(n_sessions)
+    ))
+    return [turn for session in results for turn in session], time.perf_counter() - started
+
+def bench_turns(engine: RAGEngine, args) -> Dict[str, Any]:
+    engine.index_document(document_for_chunks(args.turn_corpus_chunks, seed=args.seed),
+                          "turns.txt", namespace="bench-turns")
+    llm = GeminiLLM(api_key="", model_client=FakeGenerativeModel(
+        reply=FAKE_REPLY, latency=args.llm_latency, jitter=args.llm_jitter,
+        chunk_delay=args.llm_chunk_delay, seed=args.seed))
+    streamer = FakeAudioStreamer(edge_latency=args.tts_latency, jitter=args.tts_jitter, seed=args.seed,
+                                 cache_memory_bytes=args.tts_cache_bytes)
+
+    stt_service, clip = None, None
+    if args.voice_share > 0 and "stt" not in args.skipped:
+        from utils.stt_service import TranscriptionService
+        stt_service = TranscriptionService(num_workers=args.stt_workers, model_size=args.stt_model)
+        clip = load_clips(args)[0][1]
+        # Wait for the worker models so loading isn't counted as turn latency
+        stt_service.transcribe(clip)
+
+    # The app's pipeline with the fakes plugged in; with the default
+    # --answer-cache-entries 0 every turn reaches the LLM
+    pipeline = Pipeline(ComponentRegistry({
+        "rag_engine": lambda: engine,
+        "stt_service": lambda: stt_service,
+        "audio_streamer": lambda: streamer,
+        "llm": lambda: llm,
+    }), SemanticAnswerCache(max_entries=args.answer_cache_entries))
+
+    results = {}
+    try:
+        for n_sessions in args.sessions:
+            questions = synthetic_questions(n_sessions * args.turns, seed=args.seed + n_sessions)
+            turns, wall = asyncio.run(_run_sessions(
+                n_sessions, questions, pipeline=pipeline, clip=clip, voice_share=args.voice_share, seed=args.seed))
+            result = {"turns": len(turns), "turns_per_sec": len(turns) / wall}
+            for key in ("total", "first_token", "first_audio"):
+                for name, value in _percentiles_ms([t[key] for t in turns if key in t]).items():
+                    result[f"{key}_{name}"] = value
+            results[str(n_sessions)] = result
+            print(f"turns      : {n_sessions:>3} sessions  p50 {result['total_p50_ms']:7.1f} ms  "
+                  f"p95 {result['total_p95_ms']:7.1f} ms  first audio p50 {result['first_audio_p50_ms']:7.1f} ms  "
+                  f"{result['turns_per_sec']:.2f} turns/sec")
+    finally:
+        if stt_service is not None:
+            stt_service.shutdown()
+        engine.drop_namespace("bench-turns")
+    return results
+
+# --- Results and comparison ---
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except Exception:
+        return None
+
+def run_metadata(args) -> Dict[str, Any]:
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("compare", "baseline", "skipped")},
+    }
+
+def _flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{path}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+def _higher_is_better(metric: str) -> Optional[bool]:
+    name = metric.rsplit(".", 1)[-1]
+    if name.endswith("_per_sec"):
+        return True
+    if name.endswith(("_ms", "seconds", "real_time_factor")) and name != "audio_seconds":
+        return False
+    return None  # counts and settings are not compared
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.1) -> List[str]:
+    """
+    Prints every metric present in both result files with its relative
+    change and returns the metrics that got worse by more than threshold.
+    """
+    before, after = _flatten(baseline["results"]), _flatten(current["results"])
+    regressions = []
+    print(f"{'metric':<45} {'baseline':>12} {'current':>12} {'change':>9}")
+    for metric in sorted(before.keys() & after.keys()):
+        higher_is_better = _higher_is_better(metric)
+        if higher_is_better is None or not before[metric]:
+            continue
+        change = (after[metric] - before[metric]) / before[metric]
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > threshold:
+            flag = "  REGRESSION"
+            regressions.append(metric)
+        elif -worse > threshold:
+            flag = "  improved"
+        print(f"{metric:<45} {before[metric]:>12.3f} {after[metric]:>12.3f} {change:>+8.1%}{flag}")
+    print(f"{len(regressions)} regression(s) beyond {threshold:.0%} "
+          f"(baseline {baseline['meta'].get('git')}, current {current['meta'].get('git')})")
+    return regressions
+
+def _load(path: str) -> Dict[str, Any]:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    parser.add_argument("--output", default=os.path.join("benchmarks", "results", f"pipeline-{time.strftime('%Y%m%d-%H%M%S')}.json"))
+    parser.add_argument("--baseline", help="Earlier result file to compare this run with")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"), help="Compare two result files and exit")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change reported as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 on regressions")
+    parser.add_argument("--seed", type=int, default=0)
+    # RAG
+    parser.add_argument("--embedding-backend", default=os.getenv("EMBEDDING_BACKEND", "torch"))
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--persist-dir", help="Store the index on disk here instead of in memory")
+    parser.add_argument("--ingest-words", type=int, default=50000)
+    parser.add_argument("--corpus-chunks", nargs="+", type=int, default=[50, 200, 1000])
+    parser.add_argument("--queries", type=int, default=50, help="Queries per corpus size")
+    # STT
+    parser.add_argument("--stt-model", default="tiny")
+    parser.add_argument("--stt-threads", type=int, default=0)
+    parser.add_argument("--stt-workers", type=int, default=2, help="TranscriptionService workers for voice turns")
+    parser.add_argument("--clip-seconds", nargs="+", type=float, default=[3, 8, 15])
+    parser.add_argument("--audio-dir", help="Transcribe these audio files instead of synthetic clips")
+    # Turns
+    parser.add_argument("--sessions", nargs="+", type=int, default=[1, 4, 8])
+    parser.add_argument("--turns", type=int, default=5, help="Turns per session")
+    parser.add_argument("--turn-corpus-chunks", type=int, default=200)
+    parser.add_argument("--voice-share", type=float, default=0.5, help="Share of turns that start with STT")
+    parser.add_argument("--llm-latency", type=float, default=0.4)
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument("--llm-chunk-delay", type=float, default=0.03)
+    parser.add_argument("--tts-latency", type=float, default=0.15)
+    parser.add_argument("--tts-jitter", type=float, default=0.05)
+    parser.add_argument("--tts-cache-bytes", type=int, default=0, help="TTS cache size (0 = every sentence is synthesized)")
+    parser.add_argument("--answer-cache-entries", type=int, default=0,
+                        help="Semantic answer cache size (0 = every turn calls the LLM)")
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare_results(_load(args.compare[0]), _load(args.compare[1]), args.threshold)
+        sys.exit(1 if regressions and args.fail_on_regression else 0)
+
+    args.skipped = {}
+    if "stt" in args.stages or ("turns" in args.stages and args.voice_share > 0):
+        try:
+            import faster_whisper  # noqa: F401
+        except ImportError as e:
+            args.skipped["stt"] = str(e)
+            print(f"Speech-to-text stages skipped: {e}")
+
+    results: Dict[str, Any] = {}
+    engine = None
+    if {"ingest", "retrieval", "turns"} & set(args.stages):
+        engine = RAGEngine(persist_directory=args.persist_dir, batch_size=args.batch_size,
+                           embed_workers=args.workers, embedding_backend=args.embedding_backend)
+        # Load the embedding model up front so no stage pays for it
+        engine.embedding_fn(["warm up"])
+
+    if "ingest" in args.stages:
+        results["ingest"] = bench_ingest(engine, args)
+    if "retrieval" in args.stages:
+        results["retrieval"] = bench_retrieval(engine, args)
+    if "stt" in args.stages:
+        results["stt"] = {"skipped": args.skipped["stt"]} if "stt" in args.skipped else bench_stt(args)
+    if "turns" in args.stages:
+        results["turns"] = bench_turns(engine, args)
+
+    report = {"meta": run_metadata(args), "results": results, "stages": tracer.stats()}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_results(_load(args.baseline), report, args.threshold)
+        if regressions and args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
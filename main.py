@@ -1,54 +1,56 @@
 import streamlit as st
 import os
 import asyncio
-import edge_tts
-import tempfile
+import time
+import uuid
 from dotenv import load_dotenv
-from utils.llm import GeminiLLM
-from utils.rag import RAGEngine
-from utils.stt import STTEngine
-from utils.audio import AudioStreamer
-import PyPDF2
-from io import BytesIO
-import docx
-import csv
-
-# Initialize utils
-@st.cache_resource
-def get_audio_streamer():
-    return AudioStreamer()
-
-audio_streamer = get_audio_streamer()
+from utils.rag import content_hash
+from utils.stt_service import ServiceOverloaded
+from utils.session_store import SessionStore
+from utils.pipeline import build_pipeline
+from utils.engine_client import EngineClient
+from utils.tracing import last_trace_of, tracer
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
 
-# Initialize utils
-@st.cache_resource
-def get_llm():
-    # Try getting from st.secrets first (for Streamlit Cloud), then os.getenv (for local)
-    api_key = st.secrets.get("GEMINI_API_KEY", os.getenv("GEMINI_API_KEY"))
-    model = st.secrets.get("GEMINI_MODEL", os.getenv("GEMINI_MODEL"))
-    
-    if not api_key:
-        st.error("GEMINI_API_KEY not found. Please set it in .env or Streamlit secrets.")
-        st.stop()
-        
-    return GeminiLLM(api_key=api_key, model=model)
-
+# With ENGINE_URL set the app is a thin client of server.py; otherwise it
+# runs the same pipeline in-process
+ENGINE_URL = os.getenv("ENGINE_URL")
 
+@st.cache_resource
+def get_engine(api_key, model, persist_dir):
+    if ENGINE_URL:
+        return EngineClient(ENGINE_URL)
+    return build_pipeline(api_key, model, persist_dir)
 
 @st.cache_resource
-def get_rag_engine():
-    return RAGEngine(model_name="all-MiniLM-L6-v2")
+def start_metrics_server(port):
+    # Prometheus scrape target at /metrics (JSON at /metrics.json), one per process
+    return tracer.serve(port)
 
 @st.cache_resource
-def get_stt_engine():
-    return STTEngine(model_size="tiny", device="cpu", compute_type="int8")
+def get_session_store():
+    # Reply audio and archived transcripts spill to disk with a per-session quota
+    return SessionStore(root=os.getenv("SESSION_STORE_DIR"))
 
-llm = get_llm()
-rag_engine = get_rag_engine()
-stt_engine = get_stt_engine()
+# Try getting from st.secrets first (for Streamlit Cloud), then os.getenv (for local)
+api_key = st.secrets.get("GEMINI_API_KEY", os.getenv("GEMINI_API_KEY"))
+if not api_key and not ENGINE_URL:
+    st.error("GEMINI_API_KEY not found. Please set it in .env or Streamlit secrets.")
+    st.stop()
+
+engine = get_engine(
+    api_key,
+    st.secrets.get("GEMINI_MODEL", os.getenv("GEMINI_MODEL")),
+    # Optional on-disk index so embeddings survive restarts and redeploys
+    st.secrets.get("RAG_PERSIST_DIR", os.getenv("RAG_PERSIST_DIR"))
+)
+if os.getenv("METRICS_PORT") and not ENGINE_URL:
+    start_metrics_server(int(os.getenv("METRICS_PORT")))
+session_store = get_session_store()
 
 # Page Config
 st.set_page_config(
@@ -73,19 +75,91 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Messages kept in session state before older ones are archived to disk
+LIVE_MESSAGES = 60
+# Messages rendered per page of chat history
+HISTORY_PAGE_SIZE = 20
+
 # Session State Initialization
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+    # New sessions are a cheap moment to drop abandoned ones
+    session_store.evict_idle()
+    engine.evict_idle()
+if "rag_namespace" not in st.session_state:
+    # RAG_NAMESPACE pins every session to one shared (e.g. tenant) namespace
+    st.session_state.rag_namespace = os.getenv("RAG_NAMESPACE") or st.session_state.session_id
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "history_window" not in st.session_state:
+    st.session_state.history_window = HISTORY_PAGE_SIZE
 if "pdf_name" not in st.session_state:
     st.session_state.pdf_name = None
 
+def add_message(message):
+    """
+    Appends a chat message, archiving the oldest ones to disk beyond LIVE_MESSAGES.
+    """
+    messages = st.session_state.messages
+    messages.append(message)
+    overflow = len(messages) - LIVE_MESSAGES
+    if overflow > 0:
+        session_store.archive_messages(st.session_state.session_id, messages[:overflow])
+        del messages[:overflow]
+
+def index_files(pending_files):
+    """
+    Extracts and indexes several uploaded files concurrently, with one progress
+    bar per file. Text is streamed from utils.ingest straight into the index;
+    progress is reported from worker threads and drawn from the script thread.
+    """
+    progress = {name: (0, None) for name, _, _ in pending_files}
+    bars = {name: st.progress(0.0, text=f"Processing {name}...") for name, _, _ in pending_files}
+
+    def _tracker(name):
+        def _update(done, total):
+            progress[name] = (done, total)
+        return _update
+
+    # Worker threads can't read session state, so resolve the namespace here
+    namespace = st.session_state.rag_namespace
+    with ThreadPoolExecutor(max_workers=min(4, len(pending_files))) as pool:
+        futures = {
+            pool.submit(engine.index_upload, name, data, namespace, _tracker(name), file_hash): (name, file_hash)
+            for name, file_hash, data in pending_files
+        }
+        while True:
+            for name, (done, total) in progress.items():
+                if total:
+                    bars[name].progress(done / total, text=f"Indexing {name}... {done}/{total} chunks")
+                elif done:
+                    bars[name].progress(0.0, text=f"Indexing {name}... {done} chunks")
+            if all(future.done() for future in futures):
+                break
+            time.sleep(0.1)
+
+    for future, (name, file_hash) in futures.items():
+        bars[name].empty()
+        try:
+            future.result()
+            st.session_state.indexed_files[name] = file_hash
+            st.toast(f"Indexed {name}", icon="✅")
+        except Exception as e:
+            st.error(f"Error reading {name}: {e}")
+
 # Sidebar - Document Upload
 with st.sidebar:
     st.title("📄 Document Context")
     
-    # Initialize indexed files list if not present
+    # Initialize indexed files (name -> content hash), seeded from the store so a warm restart keeps them
+    # A per-session namespace always starts empty, so only a shared one needs the engine here
     if "indexed_files" not in st.session_state:
-        st.session_state.indexed_files = set()
+        shared = st.session_state.rag_namespace != st.session_state.session_id
+        st.session_state.indexed_files = engine.indexed_sources(st.session_state.rag_namespace) if shared else {}
+    elif st.session_state.indexed_files and not engine.corpus_version(st.session_state.rag_namespace):
+        # The namespace was evicted while idle; files still in the uploader get re-indexed below
+        st.session_state.indexed_files = {}
+        st.info("Your documents expired after inactivity and are being re-indexed.")
 
     uploaded_files = st.file_uploader(
         "Upload Documents", 
@@ -94,40 +168,15 @@ with st.sidebar:
     )
     
     if uploaded_files:
+        pending_files = []
         for uploaded_file in uploaded_files:
-            if uploaded_file.name not in st.session_state.indexed_files:
-                with st.spinner(f"Processing {uploaded_file.name}..."):
-                    try:
-                        text = ""
-                        # PDF Processing
-                        if uploaded_file.name.endswith('.pdf'):
-                            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-                            for page in pdf_reader.pages:
-                                text += page.extract_text() + "\n"
-                        
-                        # TXT Processing
-                        elif uploaded_file.name.endswith('.txt'):
-                            text = uploaded_file.read().decode("utf-8")
-                            
-                        # CSV Processing
-                        elif uploaded_file.name.endswith('.csv'):
-                            # Read as text for simplicity, or use csv module
-                            content = uploaded_file.read().decode("utf-8")
-                            text = content # Treat CSV as raw text for now
-                            
-                        # DOCX Processing
-                        elif uploaded_file.name.endswith('.docx'):
-                            doc = docx.Document(uploaded_file)
-                            text = "\n".join([para.text for para in doc.paragraphs])
-                        
-                        if text:
-                            # Index document using RAG Engine
-                            rag_engine.index_document(text, uploaded_file.name)
-                            st.session_state.indexed_files.add(uploaded_file.name)
-                            st.toast(f"Indexed {uploaded_file.name}", icon="✅")
-                            
-                    except Exception as e:
-                        st.error(f"Error reading {uploaded_file.name}: {e}")
+            data = uploaded_file.getvalue()
+            file_hash = content_hash(data)
+            if st.session_state.indexed_files.get(uploaded_file.name) != file_hash:
+                pending_files.append((uploaded_file.name, file_hash, data))
+        if pending_files:
+            # Extract and index document(s) using RAG Engine
+            index_files(pending_files)
     
     # Display Indexed Files
     if st.session_state.indexed_files:
@@ -136,69 +185,118 @@ with st.sidebar:
             st.text(f"• {f}")
             
         if st.button("Clear Database", type="primary"):
-            rag_engine.clear_database()
-            st.session_state.indexed_files = set()
+            engine.clear(st.session_state.rag_namespace)
+            st.session_state.indexed_files = {}
             st.session_state.pdf_name = None # Legacy cleanup
             st.rerun()
 
+    # Per-component load times and whether the warm-up or a first use paid for them
+    with st.expander("⏱ Startup timing"):
+        for row in engine.timings():
+            if row["error"]:
+                st.text(f"{row['component']}: failed ({row['error']})")
+            elif row["loaded"]:
+                st.text(f"{row['component']}: {row['load_seconds']:.2f}s ({row['loaded_by']})")
+            else:
+                st.text(f"{row['component']}: not loaded yet")
+
+    # Stage latencies from utils.tracing (the server's when remote), shown when DEBUG_PANEL=1
+    if os.getenv("DEBUG_PANEL") == "1":
+        with st.expander("📊 Latency by stage"):
+            snapshot = engine.metrics()
+            st.dataframe([
+                {"stage": name, "count": row["count"], "errors": row["errors"],
+                 **{q: round(row[q] * 1000) for q in ("p50", "p95", "p99")}}
+                for name, row in snapshot["stages"].items()
+            ], hide_index=True)
+            st.caption("Milliseconds over the last 1000 samples per stage")
+            last_turn = last_trace_of(snapshot["recent_spans"], "turn")
+            if last_turn:
+                st.markdown("**Last turn**")
+                st.dataframe([
+                    {"span": span["name"], "ms": round(span["duration"] * 1000), **span["attrs"]}
+                    for span in last_turn
+                ], hide_index=True)
+            st.download_button("Download metrics (JSON)", json.dumps(snapshot, default=str),
+                               file_name="metrics.json", mime="application/json")
+
 # Main Chat Interface
 st.title("🤖 Genova Assistant")
 
-# Display chat messages
-for message in st.session_state.messages:
+# Display chat messages, windowed so rerun cost doesn't grow with the conversation
+session_id = st.session_state.session_id
+live_messages = st.session_state.messages
+archived_count = session_store.archived_count(session_id)
+total_messages = archived_count + len(live_messages)
+first_visible = max(0, total_messages - st.session_state.history_window)
+if first_visible > 0:
+    if st.button(f"Show earlier messages ({first_visible} hidden)"):
+        st.session_state.history_window += HISTORY_PAGE_SIZE
+        st.rerun()
+
+visible_messages = []
+if first_visible < archived_count:
+    visible_messages = session_store.load_archived(session_id, first_visible, archived_count)
+visible_messages += live_messages[max(0, first_visible - archived_count):]
+
+for message in visible_messages:
     with st.chat_message(message["role"]):
         st.markdown(message["content"])
-        if "audio" in message:
-            st.audio(message["audio"], format="audio/mpeg", autoplay=False)
+        if "audio_ref" in message:
+            audio = session_store.get_audio(session_id, message["audio_ref"])
+            if audio:
+                st.audio(audio, format="audio/mpeg", autoplay=False)
 
 # Helper function to process input
 async def process_input(user_input, is_audio=False):
     # Add user message
-    st.session_state.messages.append({"role": "user", "content": user_input})
+    add_message({"role": "user", "content": user_input})
     with st.chat_message("user"):
         st.markdown(user_input)
 
-    # Generate response
+    # Generate response: text and audio events arrive interleaved from the engine
     with st.chat_message("assistant"):
-        with st.spinner("Retrieving context & Thinking..."):
-            # Retrieve relevant context if PDF is loaded
-            context = None
-            # Retrieve relevant context if documents are indexed
-            context = None
-            if st.session_state.indexed_files:
-                context = rag_engine.retrieve(user_input)
-            
-            response_text = await llm.generate(user_input, pdf_context=context)
-            st.markdown(response_text)
-        
-        # Generate Audio
-        with st.spinner("Generating Audio..."):
-            try:
-                audio_bytes = await audio_streamer.generate_audio(response_text)
-                
-                if audio_bytes:
-                    # Use audio/mpeg for MP3 compatibility
-                    st.audio(audio_bytes, format="audio/mpeg", autoplay=True)
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": response_text,
-                        "audio": audio_bytes
-                    })
-                else:
-                    st.warning("TTS generated no audio.")
-                    st.session_state.messages.append({
-                        "role": "assistant", 
-                        "content": response_text
-                    })
+        response_placeholder = st.empty()
+        response_placeholder.markdown("Retrieving context...")
+        response_text = ""
+        audio_segments = []
+        tts_error = None
+        async for event in engine.answer(user_input, st.session_state.rag_namespace, is_audio=is_audio):
+            if event["type"] == "text":
+                # Render the answer incrementally as tokens arrive
+                response_text += event["text"]
+                response_placeholder.markdown(response_text + "▌")
+            elif event["type"] == "audio":
+                audio_segments.append(event["data"])
+            elif event["type"] == "error":
+                tts_error = event["message"]
+            elif event["type"] == "done":
+                response_text = event["text"]
+        response_placeholder.markdown(response_text)
 
-            except Exception as e:
-                print(f"DEBUG: TTS Error details: {e}")
-                st.error("TTS Error occurred:")
-                st.exception(e)
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": response_text
-                })
+        # MP3 segments concatenate cleanly
+        audio_bytes = b"".join(audio_segments)
+        if tts_error:
+            st.error(f"TTS Error occurred: {tts_error}")
+            add_message({
+                "role": "assistant", 
+                "content": response_text
+            })
+        elif audio_bytes:
+            # Use audio/mpeg for MP3 compatibility
+            st.audio(audio_bytes, format="audio/mpeg", autoplay=True)
+            # History keeps only a reference; the clip itself lives on disk
+            add_message({
+                "role": "assistant", 
+                "content": response_text,
+                "audio_ref": session_store.put_audio(st.session_state.session_id, audio_bytes)
+            })
+        else:
+            st.warning("TTS generated no audio.")
+            add_message({
+                "role": "assistant", 
+                "content": response_text
+            })
 
 # Input Area
 # Use columns to place Audio and Text side-by-side
@@ -234,12 +332,18 @@ if audio_value:
         st.session_state.last_audio_bytes = audio_bytes
         
         with st.spinner("Transcribing..."):
-            # Use local STT engine
+            # Use local STT worker pool
             try:
-                transcript = stt_engine.transcribe(audio_bytes)
+                transcript = engine.transcribe(audio_bytes, timeout=120).text
                 if transcript and transcript.strip():
                     asyncio.run(process_input(transcript, is_audio=True))
                 else:
                     st.warning("Could not understand audio.")
+            except ServiceOverloaded:
+                st.warning("Voice transcription is busy right now. Please try again in a moment or type your message.")
             except Exception as e:
                 st.error(f"STT Error: {e}")
+
+# The page is interactive now; preload the models in the background (WARMUP=0 disables)
+if os.getenv("WARMUP", "1") != "0":
+    engine.start_warm_up()
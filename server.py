@@ -0,0 +1,279 @@
+"""
+Headless engine API.
+
+Serves utils.pipeline.Pipeline (document ingestion, retrieval, Gemini and
+TTS) over HTTP and WebSocket, independent of Streamlit reruns, so several
+clients can use it at once and it can be load-tested without a browser:
+
+    uvicorn server:app --host 0.0.0.0 --port 8000
+
+Endpoints:
+    GET    /health                                component load times
+    GET    /metrics, /metrics.json                stage latencies (utils.tracing)
+    GET    /namespaces/{namespace}                corpus version and indexed sources
+    DELETE /namespaces/{namespace}                drop a namespace's documents
+    PUT    /namespaces/{namespace}/documents/{name}
+                                                  raw file body; NDJSON progress events
+    POST   /transcribe?profile=fast               raw audio body; TranscriptionResult JSON
+    POST   /chat                                  {"question", "namespace", "with_audio"};
+                                                  NDJSON answer events (audio base64)
+    WS     /ws?namespace=...                      text frames {"question": ...} or binary
+                                                  audio frames in; JSON events and binary
+                                                  audio segments out
+    WS     /ws?namespace=...&pcm=true             binary frames of live 16 kHz int16 PCM
+                                                  with partial transcripts; {"end": true}
+                                                  answers the utterance
+
+Point the Streamlit app at it with ENGINE_URL=http://localhost:8000.
+Configuration comes from the same environment variables as the app.
+"""
+import asyncio
+import base64
+import dataclasses
+import json
+import os
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
+
+from utils.pipeline import Pipeline, build_pipeline
+from utils.rag import DEFAULT_NAMESPACE
+from utils.stt_service import ServiceOverloaded
+from utils.tracing import tracer
+
+load_dotenv()
+
+# Transcription failures reported to the client: queue full, timed out,
+# or no worker could load its model
+_STT_ERRORS = (ServiceOverloaded, FutureTimeoutError, RuntimeError)
+
+# Seconds between sweeps that drop idle namespaces
+EVICT_INTERVAL = 300
+
+async def _evict_periodically(pipeline: Pipeline):
+    while True:
+        await asyncio.sleep(EVICT_INTERVAL)
+        try:
+            dropped = await asyncio.to_thread(pipeline.evict_idle)
+            if dropped:
+                print(f"Evicted idle namespaces: {', '.join(dropped)}")
+        except Exception as e:
+            print(f"Namespace eviction failed: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY not found. Please set it in .env or the environment.")
+    pipeline = build_pipeline(api_key, os.getenv("GEMINI_MODEL"), os.getenv("RAG_PERSIST_DIR"))
+    app.state.pipeline = pipeline
+    # Start loading the models now rather than on the first request (WARMUP=0 disables)
+    if os.getenv("WARMUP", "1") != "0":
+        pipeline.start_warm_up()
+    evictor = asyncio.create_task(_evict_periodically(pipeline))
+    yield
+    evictor.cancel()
+
+app = FastAPI(title="Genova engine", lifespan=lifespan)
+
+class ChatRequest(BaseModel):
+    question: str
+    namespace: str = DEFAULT_NAMESPACE
+    with_audio: bool = True
+    is_audio: bool = False
+
+def _pipeline(request) -> Pipeline:
+    return request.app.state.pipeline
+
+def _ndjson(event: Dict[str, Any]) -> str:
+    return json.dumps(event) + "\n"
+
+def _encoded(event: Dict[str, Any]) -> Dict[str, Any]:
+    # JSON has no bytes type
+    if event["type"] == "audio":
+        return {**event, "data": base64.b64encode(event["data"]).decode("ascii")}
+    return event
+
+@app.get("/health")
+def health(request: Request):
+    return {"status": "ok", "timings": _pipeline(request).timings()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return tracer.to_prometheus()
+
+@app.get("/metrics.json")
+def metrics_json():
+    return json.loads(json.dumps(tracer.snapshot(), default=str))
+
+@app.get("/namespaces/{namespace}")
+async def get_namespace(namespace: str, request: Request):
+    pipeline = _pipeline(request)
+    version = await asyncio.to_thread(pipeline.corpus_version, namespace)
+    sources = await asyncio.to_thread(pipeline.indexed_sources, namespace) if version else {}
+    return {"namespace": namespace, "version": version, "sources": sources}
+
+@app.delete("/namespaces/{namespace}")
+async def delete_namespace(namespace: str, request: Request):
+    await asyncio.to_thread(_pipeline(request).clear, namespace)
+    return {"cleared": namespace}
+
+@app.put("/namespaces/{namespace}/documents/{name:path}")
+async def upload_document(namespace: str, name: str, request: Request, hash: Optional[str] = None):
+    """
+    Indexes the request body as file name. Streams {"type": "progress",
+    "done", "total"} events while chunks are written, then {"type":
+    "indexed", "embedded"} or {"type": "error", "message"}.
+    """
+    pipeline = _pipeline(request)
+    data = await request.body()
+    events: asyncio.Queue = asyncio.Queue()
+    loop = asyncio.get_running_loop()
+
+    def _progress(done, total):
+        # Called from the indexing threads
+        loop.call_soon_threadsafe(events.put_nowait, {"type": "progress", "done": done, "total": total})
+
+    async def _events() -> AsyncIterator[str]:
+        indexing = asyncio.ensure_future(asyncio.to_thread(pipeline.index_upload, name, data, namespace,
+                                                           _progress, hash))
+        indexing.add_done_callback(lambda _: events.put_nowait(None))
+        while (event := await events.get()) is not None:
+            yield _ndjson(event)
+        try:
+            yield _ndjson({"type": "indexed", "name": name, "embedded": indexing.result()})
+        except Exception as e:
+            yield _ndjson({"type": "error", "name": name, "message": str(e)})
+
+    return StreamingResponse(_events(), media_type="application/x-ndjson")
+
+@app.post("/transcribe")
+async def transcribe(request: Request, profile: Optional[str] = None):
+    audio_bytes = await request.body()
+    try:
+        result = await asyncio.to_thread(_pipeline(request).transcribe, audio_bytes, profile)
+    except ServiceOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return dataclasses.asdict(result)
+
+@app.post("/chat")
+async def chat(body: ChatRequest, request: Request):
+    """
+    Streams the answer events of Pipeline.answer as NDJSON; audio segments
+    are base64-encoded. A pipeline failure ends the stream with an error event.
+    """
+    pipeline = _pipeline(request)
+
+    async def _events() -> AsyncIterator[str]:
+        try:
+            async for event in pipeline.answer(body.question, body.namespace, body.with_audio, body.is_audio):
+                yield _ndjson(_encoded(event))
+        except Exception as e:
+            print(f"Chat turn failed: {e}")
+            yield _ndjson({"type": "error", "stage": "pipeline", "message": str(e)})
+
+    return StreamingResponse(_events(), media_type="application/x-ndjson")
+
+def _stt_error(error: Exception) -> Dict[str, Any]:
+    # A timeout from the transcription future has no message of its own
+    return {"type": "error", "stage": "stt", "message": str(error) or "Transcription timed out"}
+
+def _parse_frame(text: Optional[str]) -> Optional[Dict[str, Any]]:
+    """
+    A text frame as a JSON object, or None if it isn't one or its
+    "question" isn't a string.
+    """
+    try:
+        frame = json.loads(text or "")
+    except ValueError:
+        return None
+    if not isinstance(frame, dict) or not isinstance(frame.get("question", ""), str):
+        return None
+    return frame
+
+@app.websocket("/ws")
+async def chat_socket(websocket: WebSocket, namespace: str = DEFAULT_NAMESPACE, with_audio: bool = True,
+                      pcm: bool = False):
+    """
+    Conversational socket: each text frame {"question": ...} or binary
+    audio frame (transcribed first, answered with a "transcript" event) is
+    one turn. Events go out as JSON text frames and audio segments as
+    binary frames, followed by the "done" event.
+
+    With pcm=true, binary frames are instead pieces of a live 16 kHz mono
+    int16 PCM stream. They are transcribed as they arrive and answered with
+    "partial_transcript" events holding the utterance so far; the text
+    frame {"end": true} closes the utterance, which is then answered as a
+    turn.
+    """
+    pipeline = _pipeline(websocket)
+    await websocket.accept()
+    # PCM mode: the open utterance's transcriber and its finished speech segments
+    transcriber, segments = None, []
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None and pcm:
+                try:
+                    if transcriber is None:
+                        transcriber = await asyncio.to_thread(pipeline.stream_transcriber)
+                    events = await asyncio.to_thread(transcriber.feed, message["bytes"])
+                except _STT_ERRORS as e:
+                    await websocket.send_json(_stt_error(e))
+                    continue
+                for event in events:
+                    if event.kind == "final":
+                        segments.append(event.text)
+                    partial = [event.text] if event.kind == "partial" else []
+                    await websocket.send_json({"type": "partial_transcript", "text": " ".join(segments + partial)})
+                continue
+            if message.get("bytes") is not None:
+                try:
+                    result = await asyncio.to_thread(pipeline.transcribe, message["bytes"])
+                except _STT_ERRORS as e:
+                    await websocket.send_json(_stt_error(e))
+                    continue
+                await websocket.send_json({"type": "transcript", "text": result.text})
+                question, is_audio = result.text, True
+            else:
+                frame = _parse_frame(message.get("text"))
+                if frame is None:
+                    await websocket.send_json({"type": "error", "stage": "input",
+                                               "message": 'Expected a JSON object {"question": ...}'})
+                    continue
+                if pcm and frame.get("end"):
+                    try:
+                        events = await asyncio.to_thread(transcriber.finish) if transcriber else []
+                    except _STT_ERRORS as e:
+                        await websocket.send_json(_stt_error(e))
+                        events = []
+                    question = " ".join(segments + [event.text for event in events])
+                    transcriber, segments = None, []
+                    await websocket.send_json({"type": "transcript", "text": question})
+                    is_audio = True
+                else:
+                    question, is_audio = frame.get("question", ""), False
+            if not question.strip():
+                await websocket.send_json({"type": "error", "stage": "input", "message": "Empty question"})
+                continue
+
+            try:
+                async for event in pipeline.answer(question, namespace, with_audio, is_audio):
+                    if event["type"] == "audio":
+                        await websocket.send_bytes(event["data"])
+                    else:
+                        await websocket.send_json(event)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                print(f"Chat turn failed: {e}")
+                await websocket.send_json({"type": "error", "stage": "pipeline", "message": str(e)})
+    except WebSocketDisconnect:
+        pass
@@ -0,0 +1,66 @@
+"""
+Shared fixtures: an offline RAGEngine whose embedding model is replaced by
+a deterministic bag-of-words hash, so chromadb runs without downloading one.
+"""
+import hashlib
+import re
+from typing import Any, Dict, List
+
+import numpy as np
+import pytest
+
+DIMENSIONS = 64
+
+class HashEmbeddingFunction:
+    """
+    Maps each text to a normalized bag of hashed words.
+    """
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        embeddings = []
+        for text in input:
+            vector = np.zeros(DIMENSIONS, dtype=np.float32)
+            for word in re.findall(r"\w+", text.lower()):
+                vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % DIMENSIONS] += 1.0
+            embeddings.append(vector / max(float(np.linalg.norm(vector)), 1e-12))
+        return embeddings
+
+    @staticmethod
+    def name() -> str:
+        return "test_hash"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {}
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "HashEmbeddingFunction":
+        return HashEmbeddingFunction()
+
+    def is_legacy(self) -> bool:
+        return False
+
+    def default_space(self) -> str:
+        return "cosine"
+
+    def supported_spaces(self) -> List[str]:
+        return ["cosine", "l2", "ip"]
+
+@pytest.fixture
+def make_rag_engine(monkeypatch):
+    """
+    Returns a RAGEngine factory taking the constructor's keyword arguments.
+    """
+    pytest.importorskip("chromadb")
+    import utils.embeddings
+    from utils.rag import RAGEngine
+
+    monkeypatch.setattr(utils.embeddings, "create_embedding_function", lambda *args, **kwargs: HashEmbeddingFunction())
+    engines = []
+    def factory(**kwargs):
+        engine = RAGEngine(**kwargs)
+        engines.append(engine)
+        return engine
+    yield factory
+    # The ephemeral client is shared per process, so start every test empty
+    for engine in engines:
+        if not engine.persistent:
+            engine.clear_database()
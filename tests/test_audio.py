@@ -0,0 +1,48 @@
+"""
+Sentence splitting for pipelined TTS, with the offline FakeAudioStreamer.
+"""
+import asyncio
+
+from utils.audio import split_sentences
+from utils.fake_tts import FakeAudioStreamer
+
+ANSWER = ("Paris is the capital. It is in France. The Seine runs through the city centre. "
+          "Museums line both banks of the river.")
+
+async def _pieces(text, size):
+    for start in range(0, len(text), size):
+        yield text[start:start + size]
+
+def _segments(streamer, text):
+    spoken = []
+    original = streamer.generate_audio
+
+    async def _record(segment):
+        spoken.append(segment)
+        return await original(segment)
+
+    streamer.generate_audio = _record
+    async def run():
+        return [data async for data in streamer.stream_audio(text)]
+    try:
+        asyncio.run(run())
+    finally:
+        del streamer.generate_audio
+    return spoken
+
+def test_short_sentence_keeps_its_separator():
+    segments, remainder = split_sentences("Paris is the capital. ", min_chars=40)
+    assert segments == []
+    assert (remainder + "It is in France.").startswith("Paris is the capital. It")
+
+def test_streamed_and_whole_answer_split_alike_and_share_the_cache():
+    streamer = FakeAudioStreamer(edge_latency=0.0, per_char=0.0)
+    # Pieces end right after "capital. " so the short sentence is carried over
+    streamed = _segments(streamer, _pieces(ANSWER, 22))
+    assert not any(".I" in segment or ".T" in segment for segment in streamed)
+
+    replayed = _segments(streamer, ANSWER)
+    assert [s.strip() for s in replayed] == [s.strip() for s in streamed]
+    stats = streamer.cache_stats()
+    assert stats["hits"] == len(replayed)
+    assert stats["misses"] == len(streamed)
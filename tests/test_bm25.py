@@ -0,0 +1,19 @@
+"""
+BM25 tokenizer and keyword search.
+"""
+from utils.bm25 import BM25Index, tokenize
+
+def test_compound_identifier_emits_whole_parts_and_joined_form():
+    assert tokenize("Order AB-1234 shipped") == ["order", "ab-1234", "ab", "1234", "ab1234", "shipped"]
+
+def test_dot_joins_numbers_but_not_words():
+    assert tokenize("v2.5") == ["v2.5", "v2", "5", "v25"]
+    assert tokenize("the end.Next line") == ["the", "end", "next", "line"]
+
+def test_spoken_and_joined_forms_find_the_identifier():
+    index = BM25Index()
+    index.add("part", "Replacement part AB-1234 fits the 2019 model.")
+    index.add("other", "The warranty covers every other part number.")
+
+    for query in ("AB 1234", "1234", "AB1234", "ab-1234"):
+        assert index.search(query, k=1)[0][0] == "part"
@@ -0,0 +1,41 @@
+"""
+Context assembly: budget charged in rank order, adjacent chunks merged.
+"""
+from utils.context import CHUNK_TOKENS, assemble_context
+
+def _chunks(n, words=400, overlap=50):
+    # Word-window chunks like split_text's, with recognizable words per position
+    text = [f"w{i}" for i in range(n * (words - overlap) + overlap)]
+    step = words - overlap
+    return [" ".join(text[i * step:i * step + words]) for i in range(n)]
+
+def _hit(chunks, chunk_id, source="doc.pdf"):
+    return {"id": f"{source}_{chunk_id}", "document": chunks[chunk_id],
+            "metadata": {"source": source, "chunk_id": chunk_id}}
+
+def test_low_ranked_neighbour_does_not_displace_better_hits():
+    chunks = _chunks(8)
+    hits = [_hit(chunks, i) for i in (0, 3, 5, 7, 1)]
+
+    context = assemble_context(hits, token_budget=1500)
+    # The budget fits the top two hits; chunk 1 (5th) must not take chunk 3's place
+    assert context.count("[Source: doc.pdf]") == 2
+    assert chunks[3] in context
+    assert chunks[1].split()[-1] not in context
+
+def test_adjacent_selected_chunks_merge_without_overlap():
+    chunks = _chunks(3)
+    context = assemble_context([_hit(chunks, 1), _hit(chunks, 0)], token_budget=10000)
+
+    passages = context.split("\n\n")
+    assert len(passages) == 1
+    words = passages[0].split("\n", 1)[1].split()
+    assert words == [f"w{i}" for i in range(750)]
+
+def test_default_budget_fits_every_hit():
+    chunks = _chunks(10)
+    hits = [_hit(chunks, i) for i in (0, 2, 4, 6, 8)]
+
+    context = assemble_context(hits)
+    assert context.count("[Source: doc.pdf]") == 5
+    assert CHUNK_TOKENS * 5 >= len(context) // 4
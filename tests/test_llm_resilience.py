@@ -0,0 +1,64 @@
+"""
+GeminiLLM retries, deadlines and hedging against the offline fake client:
+
+    python -m pytest tests
+"""
+import asyncio
+import time
+
+from utils.fake_llm import FakeGenerativeModel, FakeInvalidArgument, FakeServiceUnavailable
+from utils.llm import ERROR_PREFIX, GeminiLLM
+from utils.resilience import RetryPolicy
+
+REPLY = "The answer is forty-two."
+
+def _llm(fake: FakeGenerativeModel, **kwargs) -> GeminiLLM:
+    kwargs.setdefault("retry", RetryPolicy(max_attempts=3, base_delay=0.01))
+    kwargs.setdefault("hedge_percentile", None)
+    return GeminiLLM(api_key="", model_client=fake, **kwargs)
+
+def _timed_generate(llm: GeminiLLM):
+    # Timed around asyncio.run, as main.py runs each turn: abandoned attempts must not hold it up
+    started = time.monotonic()
+    answer = asyncio.run(llm.generate("question"))
+    return answer, time.monotonic() - started
+
+def test_transient_error_is_retried():
+    fake = FakeGenerativeModel(reply=REPLY, failures=[FakeServiceUnavailable("503 overloaded")])
+    llm = _llm(fake)
+
+    assert asyncio.run(llm.generate("question")) == REPLY
+    assert fake.calls == 2
+    assert llm.metrics()["outcomes"] == {"ok": 1}
+
+def test_permanent_error_is_not_retried():
+    fake = FakeGenerativeModel(reply=REPLY, failures=[FakeInvalidArgument("400 bad request")])
+    llm = _llm(fake)
+
+    answer = asyncio.run(llm.generate("question"))
+    assert answer.startswith(ERROR_PREFIX)
+    assert "400 bad request" in answer
+    assert fake.calls == 1
+    assert llm.metrics()["outcomes"] == {"error": 1}
+
+def test_deadline_is_enforced():
+    fake = FakeGenerativeModel(reply=REPLY, latency=5.0)
+    llm = _llm(fake, timeout=0.3)
+
+    answer, elapsed = _timed_generate(llm)
+    assert elapsed < 1.0
+    assert answer.startswith(ERROR_PREFIX)
+    assert llm.metrics()["outcomes"] == {"timeout": 1}
+
+def test_slow_attempt_is_hedged():
+    # The first attempt hangs; the duplicate started after the p95 of earlier calls answers
+    fake = FakeGenerativeModel(reply=REPLY, latency=[2.0, 0.01])
+    llm = _llm(fake, hedge_percentile=0.95)
+    for _ in range(llm.latency.min_samples):
+        llm.latency.record(0.02)
+
+    answer, elapsed = _timed_generate(llm)
+    assert answer == REPLY
+    assert elapsed < 1.0
+    assert fake.calls == 2
+    assert llm.metrics()["hedge_rate"] == 1.0
@@ -0,0 +1,48 @@
+"""
+Pipeline.answer with stand-in components: blocking engine calls stay off the event loop.
+"""
+import asyncio
+import threading
+
+from utils.fake_llm import FakeGenerativeModel
+from utils.lazy import ComponentRegistry
+from utils.llm import GeminiLLM
+from utils.pipeline import Pipeline
+from utils.resilience import RetryPolicy
+
+class _ThreadCheckingEngine:
+    """
+    RAGEngine stand-in that records which thread each call ran on.
+    """
+    def __init__(self):
+        self.threads = []
+
+    def _record(self):
+        self.threads.append(threading.current_thread())
+
+    def corpus_version(self, namespace):
+        self._record()
+        return 1
+
+    def retrieve(self, question, namespace):
+        self._record()
+        return "[Source: notes.txt]\nThe answer is forty-two."
+
+    def embed_query(self, question):
+        self._record()
+        return [1.0, 0.0]
+
+def test_engine_calls_run_off_the_event_loop():
+    engine = _ThreadCheckingEngine()
+    llm = GeminiLLM(api_key="", model_client=FakeGenerativeModel(reply="Forty-two."),
+                    retry=RetryPolicy(max_attempts=1), hedge_percentile=None)
+    pipeline = Pipeline(ComponentRegistry({"rag_engine": lambda: engine, "llm": lambda: llm}))
+
+    async def run():
+        loop_thread = threading.current_thread()
+        events = [event async for event in pipeline.answer("What is the answer?", "team", with_audio=False)]
+        return loop_thread, events
+
+    loop_thread, events = asyncio.run(run())
+    assert events[-1] == {"type": "done", "text": "Forty-two.", "cached": False}
+    assert engine.threads and loop_thread not in engine.threads
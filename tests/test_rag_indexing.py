@@ -0,0 +1,83 @@
+"""
+RAGEngine indexing: incremental re-embedding of edited documents and
+rollback of a failed re-index.
+"""
+import random
+
+import pytest
+
+def _document(n_words=6000, seed=1):
+    rnd = random.Random(seed)
+    vocabulary = "revenue margin quarter report engine vector index delta gamma policy".split()
+    return [f"{rnd.choice(vocabulary)}{rnd.randint(0, 99)}" for _ in range(n_words)]
+
+def test_inserted_word_only_reembeds_nearby_chunks(make_rag_engine):
+    engine = make_rag_engine()
+    words = _document()
+    total = engine.index_document(" ".join(words), "notes.txt")
+    assert total > 10
+
+    words.insert(100, "inserted")
+    assert engine.index_document(" ".join(words), "notes.txt") <= 2
+
+def test_chunks_respect_size_and_overlap(make_rag_engine):
+    engine = make_rag_engine()
+    chunks = engine.split_text(" ".join(_document()), chunk_size=400, overlap=50)
+
+    assert all(len(chunk.split()) <= 400 for chunk in chunks)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert prev.split()[-50:] == nxt.split()[:50]
+
+def test_complete_doc_hash_needs_one_hash_and_the_marker():
+    from utils.rag import _complete_doc_hash
+
+    chunks = [{"doc_hash": "a", "doc_chunks": 2, "complete_hash": "a"}, {"doc_hash": "a"}]
+    assert _complete_doc_hash(chunks) == "a"
+    assert _complete_doc_hash([{"doc_hash": "a"}, {"doc_hash": "a"}]) is None
+    assert _complete_doc_hash([chunks[0], {"doc_hash": "b"}]) is None
+    assert _complete_doc_hash(chunks[:1] + chunks) is None
+    # A marker left over from the previous version of the document
+    stale = [{"doc_hash": "b", "doc_chunks": 2, "complete_hash": "a"}, {"doc_hash": "b"}]
+    assert _complete_doc_hash(stale) is None
+
+def test_failed_reindex_leaves_no_partial_document(make_rag_engine):
+    engine = make_rag_engine(batch_size=2, embed_workers=1)
+    engine.index_document(" ".join(_document(3000, seed=1)), "notes.txt")
+    assert engine.indexed_sources() != {}
+
+    def _segments():
+        yield " ".join(_document(3000, seed=2))
+        raise OSError("upload interrupted")
+
+    with pytest.raises(OSError):
+        engine.index_document(_segments(), "notes.txt", doc_hash="v2")
+    # Neither the old version nor a prefix of the new one is left to be served
+    assert engine.indexed_sources() == {}
+    assert engine.retrieve("revenue") == ""
+
+    assert engine.index_document(" ".join(_document(3000, seed=2)), "notes.txt") > 0
+    assert engine.indexed_sources()["notes.txt"]
+
+def test_crash_during_reindex_of_longer_version_is_not_complete(make_rag_engine, monkeypatch):
+    engine = make_rag_engine(batch_size=1, embed_workers=1)
+    engine.index_document(" ".join(_document(1500, seed=1)), "notes.txt")
+    old_chunks = engine.collection.count()
+    longer = engine.split_text(" ".join(_document(6000, seed=2)))
+    assert len(longer) > old_chunks + 2
+
+    def _chunks():
+        # With one batch embedding ahead, the stream fails once exactly as many
+        # new chunks are written as the old version had, all under the old IDs
+        yield from ((chunk, None) for chunk in longer[:old_chunks + 2])
+        raise SystemExit("killed")
+
+    # A dead process runs no rollback
+    monkeypatch.setattr(engine, "_delete_ids", lambda namespace, ids: None)
+    with pytest.raises(SystemExit):
+        engine.index_chunks(_chunks(), "notes.txt", doc_hash="v2")
+    monkeypatch.undo()
+    assert engine.collection.count() == old_chunks
+
+    assert engine.indexed_sources() == {"notes.txt": ""}
+    engine.index_chunks(((chunk, None) for chunk in longer), "notes.txt", doc_hash="v2")
+    assert engine.indexed_sources() == {"notes.txt": "v2"}
@@ -0,0 +1,64 @@
+"""
+Namespace eviction in RAGEngine, in memory and with a persistent index.
+"""
+import uuid
+
+TEXT = "The quarterly report lists revenue, margins and the AB-1234 part number."
+
+def _stored_namespaces(engine):
+    return {meta["namespace"] for meta in engine.collection.get(include=["metadatas"])["metadatas"]}
+
+def test_idle_session_namespace_is_deleted_when_persistent(make_rag_engine, tmp_path):
+    engine = make_rag_engine(persist_directory=str(tmp_path), namespace_ttl=60)
+    session, team = uuid.uuid4().hex, "team"
+    engine.index_document(TEXT, "report.txt", namespace=session)
+    engine.index_document(TEXT, "report.txt", namespace=team)
+
+    assert sorted(engine.evict_idle(ttl_seconds=0)) == sorted([session, team])
+    # The session's chunks are gone; the shared namespace only spilled its keyword index
+    assert _stored_namespaces(engine) == {team}
+    assert engine.corpus_version(session) == 0
+    assert engine.corpus_version(team)
+    assert "AB-1234" in engine.retrieve("revenue", namespace=team)
+
+def test_restart_skips_idle_namespaces_and_drops_orphaned_sessions(make_rag_engine, tmp_path):
+    engine = make_rag_engine(persist_directory=str(tmp_path), pinned_namespaces=["default"])
+    session = uuid.uuid4().hex
+    for namespace in ("default", "team", session):
+        engine.index_document(TEXT, "report.txt", namespace=namespace)
+
+    restarted = make_rag_engine(persist_directory=str(tmp_path), pinned_namespaces=["default"])
+    # Only the pinned namespace is held in memory; the shared one loads on use
+    assert set(restarted.namespace_stats()) == {"default"}
+    assert _stored_namespaces(restarted) == {"default", "team"}
+    assert "AB-1234" in restarted.retrieve("revenue", namespace="team")
+    assert set(restarted.namespace_stats()) == {"default", "team"}
+
+def test_in_memory_eviction_deletes_chunks(make_rag_engine):
+    engine = make_rag_engine(namespace_ttl=60)
+    engine.index_document(TEXT, "report.txt", namespace="team")
+
+    assert engine.evict_idle(ttl_seconds=0) == ["team"]
+    assert _stored_namespaces(engine) == set()
+
+def test_reupload_after_restart_or_eviction_embeds_nothing(make_rag_engine, tmp_path):
+    engine = make_rag_engine(persist_directory=str(tmp_path), namespace_ttl=60)
+    text = " ".join(f"{word}{i}" for i in range(2000) for word in ("revenue",))
+    assert engine.index_document(text, "report.txt", namespace=uuid.uuid4().hex) > 0
+
+    # Idle eviction deletes the session's chunks, not their embeddings
+    engine.evict_idle(ttl_seconds=0)
+    assert engine.collection.count() == 0
+    assert engine.index_document(text, "report.txt", namespace=uuid.uuid4().hex) == 0
+
+    # After a restart the session's chunks are deleted as orphans
+    restarted = make_rag_engine(persist_directory=str(tmp_path))
+    assert restarted.collection.count() == 0
+    assert restarted.index_document(text, "report.txt", namespace=uuid.uuid4().hex) == 0
+
+def test_in_memory_reupload_after_eviction_embeds_nothing(make_rag_engine):
+    engine = make_rag_engine(namespace_ttl=60)
+    assert engine.index_document(TEXT, "report.txt", namespace="team") == 1
+    engine.evict_idle(ttl_seconds=0)
+
+    assert engine.index_document(TEXT, "report.txt", namespace="team") == 0
@@ -0,0 +1,79 @@
+"""
+CircuitBreaker state changes on a manual clock, and the Edge TTS breaker
+around a cancelled synthesis.
+"""
+import asyncio
+
+from utils.fake_tts import FakeAudioStreamer
+from utils.resilience import CircuitBreaker
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def _opened_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    return breaker
+
+def test_half_open_allows_a_single_probe():
+    clock = _Clock()
+    breaker = _opened_breaker(clock)
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+def test_released_probe_lets_the_next_caller_probe():
+    clock = _Clock()
+    breaker = _opened_breaker(clock)
+    clock.now = 10
+    assert breaker.allow()
+
+    breaker.release()
+    assert breaker.allow()
+
+def test_probe_that_never_reports_back_expires():
+    clock = _Clock()
+    breaker = _opened_breaker(clock)
+    clock.now = 10
+    assert breaker.allow()
+
+    clock.now = 15
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.allow()
+
+def test_cancelled_edge_probe_frees_the_breaker():
+    clock = _Clock()
+    streamer = FakeAudioStreamer(edge_latency=0.0, gtts_latency=0.0, per_char=0.0, cache_memory_bytes=0,
+                                 edge_failures=[ConnectionError("403")])
+    streamer.edge_breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60, clock=clock)
+
+    async def run():
+        await streamer.generate_audio("First sentence.")
+        assert streamer.edge_breaker.state == CircuitBreaker.OPEN
+
+        # The half-open probe hangs and its turn is cancelled
+        clock.now = 60
+        streamer.edge_latency = 5.0
+        probe = asyncio.create_task(streamer.generate_audio("Second sentence."))
+        await asyncio.sleep(0.05)
+        assert streamer.edge_breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+        # Without waiting out another cool-down, the next call probes Edge again
+        streamer.edge_latency = 0.0
+        await streamer.generate_audio("Third sentence.")
+
+    asyncio.run(run())
+    assert streamer.edge_calls == 3
+    assert streamer.edge_breaker.state == CircuitBreaker.CLOSED
@@ -0,0 +1,73 @@
+"""
+WebSocket handling in server.py against a stand-in pipeline.
+"""
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient
+
+import server
+from utils.stt import StreamingTranscriber
+
+class _LengthEngine:
+    def transcribe_samples(self, samples, latency_profile=None):
+        return f"{len(samples) / StreamingTranscriber.SAMPLE_RATE:.0f} seconds"
+
+class _EchoPipeline:
+    transcribe_error = None
+
+    def transcribe(self, audio_bytes, latency_profile=None, timeout=120):
+        raise self.transcribe_error
+
+    def stream_transcriber(self, **kwargs):
+        return StreamingTranscriber(_LengthEngine(), silence_ms=300, **kwargs)
+
+    async def answer(self, question, namespace, with_audio=True, is_audio=False):
+        yield {"type": "text", "text": question}
+        yield {"type": "done", "text": question, "cached": False}
+
+@pytest.fixture
+def client(monkeypatch):
+    # Without the context manager the lifespan (and its real pipeline) never starts
+    monkeypatch.setattr(server.app.state, "pipeline", _EchoPipeline(), raising=False)
+    return TestClient(server.app)
+
+@pytest.mark.parametrize("frame", ["not json", "[1, 2]", '"question"', '{"question": 42}'])
+def test_malformed_text_frame_is_rejected_and_socket_stays_open(client, frame):
+    with client.websocket_connect("/ws?with_audio=false") as socket:
+        socket.send_text(frame)
+        assert socket.receive_json()["stage"] == "input"
+
+        socket.send_json({"question": "still there?"})
+        assert socket.receive_json() == {"type": "text", "text": "still there?"}
+        assert socket.receive_json()["type"] == "done"
+
+def test_pcm_stream_sends_partials_then_answers_the_utterance(client):
+    speech = (b"\x00\x10" * StreamingTranscriber.SAMPLE_RATE)  # one second at a constant level
+    silence = b"\x00\x00" * (StreamingTranscriber.SAMPLE_RATE // 2)
+    with client.websocket_connect("/ws?with_audio=false&pcm=true") as socket:
+        socket.send_bytes(speech + b"\x00\x10" * (StreamingTranscriber.SAMPLE_RATE // 2))
+        assert socket.receive_json() == {"type": "partial_transcript", "text": "1 seconds"}
+        socket.send_bytes(silence)
+        assert socket.receive_json()["type"] == "partial_transcript"
+
+        socket.send_json({"end": True})
+        transcript = socket.receive_json()
+        assert transcript["type"] == "transcript" and transcript["text"].endswith("seconds")
+        assert socket.receive_json() == {"type": "text", "text": transcript["text"]}
+        assert socket.receive_json()["type"] == "done"
+
+@pytest.mark.parametrize("error", [RuntimeError("No speech-to-text worker could load its model"),
+                                   FutureTimeoutError()])
+def test_failed_clip_transcription_is_reported_and_socket_stays_open(client, monkeypatch, error):
+    monkeypatch.setattr(_EchoPipeline, "transcribe_error", error)
+    with client.websocket_connect("/ws?with_audio=false") as socket:
+        socket.send_bytes(b"clip")
+        event = socket.receive_json()
+        assert event["stage"] == "stt" and event["message"]
+
+        socket.send_json({"question": "still there?"})
+        assert socket.receive_json() == {"type": "text", "text": "still there?"}
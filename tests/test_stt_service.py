@@ -0,0 +1,62 @@
+"""
+TranscriptionService queueing with stand-in engines instead of Whisper.
+"""
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+import pytest
+
+from utils.stt_service import TranscriptionService
+
+class _BlockingEngine:
+    """
+    Transcribes once released, recording every clip it was given.
+    """
+    def __init__(self, release: threading.Event, seen: list):
+        self.release = release
+        self.seen = seen
+
+    def transcribe_with_info(self, audio_bytes, profile):
+        self.seen.append(audio_bytes)
+        self.release.wait(5)
+        return audio_bytes.decode(), 1.0
+
+def _failing_engine(**kwargs):
+    raise OSError("model download failed")
+
+def test_callers_fail_once_every_worker_failed_to_load():
+    service = TranscriptionService(num_workers=2, engine_factory=_failing_engine)
+
+    with pytest.raises(RuntimeError, match="model download failed"):
+        service.transcribe(b"clip", timeout=5)
+    assert service.failed
+
+def test_timed_out_request_is_not_transcribed_later():
+    release, seen = threading.Event(), []
+    service = TranscriptionService(num_workers=1, engine_factory=lambda **kwargs: _BlockingEngine(release, seen))
+    busy = service.submit(b"first")
+
+    with pytest.raises(FutureTimeoutError):
+        service.transcribe(b"abandoned", timeout=0.1)
+    release.set()
+    assert busy.result(timeout=5).text == "first"
+    assert service.transcribe(b"next", timeout=5).text == "next"
+    service.shutdown()
+    assert seen == [b"first", b"next"]
+
+def test_stream_decodes_samples_on_the_pool():
+    import numpy as np
+
+    class _SampleEngine:
+        def transcribe_samples(self, samples, profile):
+            return f"{len(samples)} samples"
+
+    service = TranscriptionService(num_workers=1, engine_factory=lambda **kwargs: _SampleEngine())
+    transcriber = service.stream()
+    speech = (np.full(16000, 0.2) * 32767).astype("<i2").tobytes()
+
+    assert transcriber.feed(speech) == []
+    [event] = transcriber.finish()
+    assert event.kind == "final" and event.text.endswith("samples")
+    assert service.stats()["avg_real_time_factor"] >= 0
+    service.shutdown()
@@ -0,0 +1,54 @@
+"""
+StreamingTranscriber segmentation with a stand-in engine instead of Whisper.
+"""
+import numpy as np
+
+from utils.stt import StreamingTranscriber
+
+RATE = StreamingTranscriber.SAMPLE_RATE
+
+class _RecordingEngine:
+    """
+    "Transcribes" samples as their duration, recording each decode.
+    """
+    def __init__(self):
+        self.decoded = []
+
+    def transcribe_samples(self, samples, latency_profile=None):
+        self.decoded.append((len(samples) / RATE, latency_profile))
+        return f"{len(samples) / RATE:.1f}s"
+
+def _pcm(seconds, speech=True):
+    samples = np.full(int(seconds * RATE), 0.2 if speech else 0.0)
+    return (samples * 32767).astype("<i2").tobytes()
+
+def test_speech_then_silence_emits_partials_and_one_final():
+    engine = _RecordingEngine()
+    transcriber = StreamingTranscriber(engine, partial_interval_ms=1000, silence_ms=300)
+
+    events = []
+    for piece in [_pcm(2.5), _pcm(0.5, speech=False)]:
+        events += transcriber.feed(piece)
+    assert [event.kind for event in events] == ["partial", "partial", "final"]
+    assert engine.decoded[-1][1] is None and all(profile == "fast" for _, profile in engine.decoded[:-1])
+
+def test_partials_decode_at_most_the_window():
+    engine = _RecordingEngine()
+    transcriber = StreamingTranscriber(engine, partial_interval_ms=1000, partial_window_s=3.0)
+
+    for _ in range(10):
+        transcriber.feed(_pcm(1.0))
+    partial_lengths = [seconds for seconds, profile in engine.decoded if profile == "fast"]
+    assert len(partial_lengths) >= 9
+    assert max(partial_lengths) <= 3.0
+
+def test_failed_partial_does_not_break_the_stream():
+    class _BusyEngine(_RecordingEngine):
+        def transcribe_samples(self, samples, latency_profile=None):
+            if latency_profile == "fast":
+                raise RuntimeError("queue full")
+            return super().transcribe_samples(samples, latency_profile)
+
+    transcriber = StreamingTranscriber(_BusyEngine(), partial_interval_ms=500)
+    assert transcriber.feed(_pcm(2.0)) == []
+    assert [event.kind for event in transcriber.finish()] == ["final"]
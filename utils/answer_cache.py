@@ -0,0 +1,80 @@
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+class SemanticAnswerCache:
+    """
+    Cache of LLM answers keyed by query embedding and retrieved context.
+
+    A lookup hits when a cached question has cosine similarity >= threshold
+    to the new one, was answered from the identical context (same
+    fingerprint) and was stored under the same corpus version. The version
+    can be any hashable, e.g. (namespace, version) so sessions with separate
+    corpora share one cache. Entries for superseded versions never match
+    again; they expire after ttl_seconds like the rest, and the least
+    recently used are evicted beyond max_entries.
+    """
+    def __init__(self, threshold: float = 0.92, ttl_seconds: float = 3600.0, max_entries: int = 512):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: Sequence[float], fingerprint: str, corpus_version) -> Optional[str]:
+        """
+        Returns a cached answer for a similar question over the same context, or None.
+        """
+        now = time.monotonic()
+        query = self._unit(embedding)
+        with self._lock:
+            self._entries = [e for e in self._entries if now - e["created"] < self.ttl_seconds]
+            candidates = [e for e in self._entries
+                          if e["fingerprint"] == fingerprint and e["version"] == corpus_version]
+            if candidates:
+                scores = np.stack([e["vector"] for e in candidates]) @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    candidates[best]["last_used"] = now
+                    self.hits += 1
+                    return candidates[best]["answer"]
+            self.misses += 1
+            return None
+
+    def store(self, embedding: Sequence[float], fingerprint: str, corpus_version, answer: str):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.append({
+                "vector": self._unit(embedding),
+                "fingerprint": fingerprint,
+                "version": corpus_version,
+                "answer": answer,
+                "created": now,
+                "last_used": now,
+            })
+            if len(self._entries) > self.max_entries:
+                self._entries.remove(min(self._entries, key=lambda e: e["last_used"]))
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+        }
@@ -1,13 +1,76 @@
-import edge_tts
 import asyncio
-import tempfile
-import os
+import hashlib
+import io
 import re
-from gtts import gTTS
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Tuple, Union
+from utils.cache import TieredByteCache
+from utils.resilience import CircuitBreaker
+from utils.tracing import tracer
+
+# A sentence ends at . ! or ? followed by whitespace
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def split_sentences(buffer: str, min_chars: int = 40) -> Tuple[List[str], str]:
+    """
+    Splits complete sentences off the front of buffer.
+    Short sentences are merged until a segment has at least min_chars so
+    tiny fragments don't each cost a TTS round-trip. Returns the segments
+    and the unfinished remainder.
+    """
+    parts = _SENTENCE_END.split(buffer)
+    remainder = parts.pop()
+    segments = []
+    current = ""
+    for part in parts:
+        current = f"{current} {part}" if current else part
+        if len(current) >= min_chars:
+            segments.append(current)
+            current = ""
+    if current:
+        # Keep the separator, or the next streamed piece is glued onto the sentence
+        remainder = f"{current} {remainder}" if remainder else f"{current} "
+    return segments, remainder
+
+async def _single(text: str) -> AsyncIterator[str]:
+    yield text
 
 class AudioStreamer:
-    def __init__(self, voice: str = "en-US-AriaNeural"):
+    def __init__(self, voice: str = "en-US-AriaNeural", breaker_threshold: int = 3, breaker_cooldown: float = 60.0,
+                 cache_memory_bytes: int = 32 * 1024 * 1024, cache_dir: Optional[str] = None,
+                 cache_disk_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            voice: Edge TTS voice name.
+            breaker_threshold: Consecutive Edge TTS failures before requests go
+                straight to gTTS.
+            breaker_cooldown: Seconds to stay on gTTS before probing Edge again.
+            cache_memory_bytes: Size cap of the in-memory synthesized-audio cache.
+            cache_dir: Optional directory for a second, on-disk cache tier.
+            cache_disk_bytes: Size cap of the on-disk tier.
+        """
         self.voice = voice
+        self.edge_breaker = CircuitBreaker(failure_threshold=breaker_threshold, reset_timeout=breaker_cooldown)
+        self.audio_cache = TieredByteCache(
+            max_memory_bytes=cache_memory_bytes,
+            directory=cache_dir,
+            max_disk_bytes=cache_disk_bytes
+        )
+
+    def preload(self):
+        """
+        Imports the TTS libraries now rather than on the first synthesis.
+        """
+        import edge_tts  # noqa: F401
+        import gtts  # noqa: F401
+
+    def _cache_key(self, clean_text: str) -> str:
+        return hashlib.sha256(f"{self.voice}\0{clean_text}".encode("utf-8")).hexdigest()
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Returns hit rate and bytes saved by the synthesized-audio cache.
+        """
+        return self.audio_cache.stats()
 
     def clean_text(self, text: str) -> str:
         """
@@ -34,7 +97,15 @@ class AudioStreamer:
         """
         Generates audio using edge-tts and returns bytes.
         Fallback to gTTS if edge-tts fails (e.g. 403 error on cloud).
+        After repeated Edge failures the circuit breaker sends requests straight
+        to gTTS for a cool-down window, then probes Edge again.
         """
+        with tracer.span("tts.generate_audio", text_chars=len(text or "")) as span:
+            data = await self._generate_audio(text, span)
+            span.set(audio_bytes=len(data))
+            return data
+
+    async def _generate_audio(self, text: str, span) -> bytes:
         if not text or not text.strip():
             return b""
             
@@ -43,69 +114,136 @@ class AudioStreamer:
         if not clean_text:
             return b""
             
-        # Try Edge TTS first
+        # Repeat utterances (canned answers, refusals) are served without any TTS call
+        cache_key = self._cache_key(clean_text)
+        cached = self.audio_cache.get(cache_key)
+        if cached is not None:
+            stats = self.audio_cache.stats()
+            print(f"TTS cache hit: {len(cached)} bytes (hit rate {stats['hit_rate']:.0%}, {stats['bytes_saved']} bytes saved)")
+            span.set(engine="cache")
+            return cached
+
+        # Try Edge TTS first, unless it has been failing and the breaker is open
+        if self.edge_breaker.allow():
+            outcome_recorded = False
+            try:
+                data = await self._edge_synthesize(clean_text)
+                self.edge_breaker.record_success()
+                outcome_recorded = True
+                print(f"EdgeTTS Success: Generated {len(data)} bytes")
+                self.audio_cache.put(cache_key, data)
+                span.set(engine="edge")
+                return data
+            except Exception as e:
+                self.edge_breaker.record_failure()
+                outcome_recorded = True
+                print(f"EdgeTTS failed: {e}. Switching to gTTS fallback...")
+            finally:
+                # Cancelled mid-call: free the breaker's probe slot rather than leave it taken
+                if not outcome_recorded:
+                    self.edge_breaker.release()
+
+        # Fallback to gTTS
         try:
-            communicate = edge_tts.Communicate(clean_text, self.voice)
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-                tmp_path = tmp_file.name
-            
-            await communicate.save(tmp_path)
-            
-            with open(tmp_path, "rb") as f:
-                data = f.read()
-            
-            print(f"EdgeTTS Success: Generated {len(data)} bytes")
-            if os.path.exists(tmp_path):
-                os.remove(tmp_path)
+            # Run gTTS in a separate thread to avoid blocking asyncio loop
+            loop = asyncio.get_event_loop()
+            data = await loop.run_in_executor(None, self._gtts_synthesize, clean_text)
+            print(f"gTTS Success: Generated {len(data)} bytes")
+            if data:
+                self.audio_cache.put(cache_key, data)
+            span.set(engine="gtts")
             return data
             
-        except Exception as e:
-            print(f"EdgeTTS failed: {e}. Switching to gTTS fallback...")
+        except Exception as e2:
+            print(f"gTTS fallback failed: {e2}")
+            span.set(engine="none", error=type(e2).__name__)
+            return b""
+
+    async def _edge_synthesize(self, text: str) -> bytes:
+        """
+        Collects Edge TTS audio chunks straight into memory.
+        """
+        import edge_tts
+        communicate = edge_tts.Communicate(text, self.voice)
+        buffer = io.BytesIO()
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                buffer.write(chunk["data"])
+        data = buffer.getvalue()
+        if not data:
+            raise RuntimeError("Edge TTS returned no audio")
+        return data
+
+    def _gtts_synthesize(self, text: str) -> bytes:
+        """
+        Synthesizes with gTTS and speeds it up with pydub, all in memory.
+        """
+        from gtts import gTTS
+
+        # Generate slow audio
+        buffer = io.BytesIO()
+        gTTS(text=text, lang='en').write_to_fp(buffer)
+        data = buffer.getvalue()
+
+        # Speed up audio using pydub
+        try:
+            from pydub import AudioSegment
+            audio = AudioSegment.from_file(io.BytesIO(data), format="mp3")
+            fast_audio = audio.speedup(playback_speed=1.2)
             
-            # Fallback to gTTS
+            # Export to buffer
+            fast_buffer = io.BytesIO()
+            fast_audio.export(fast_buffer, format="mp3")
+            return fast_buffer.getvalue()
+        except Exception as e_pydub:
+            print(f"Pydub speedup failed: {e_pydub}. Using normal speed.")
+            return data
+
+    async def stream_audio(self, text: Union[str, AsyncIterable[str]], max_concurrency: int = 3,
+                           min_chars: int = 40) -> AsyncIterator[bytes]:
+        """
+        Pipelined TTS: splits text at sentence boundaries as it arrives,
+        synthesizes up to max_concurrency segments at once and yields the
+        audio of each segment in order, so the first sentence is ready while
+        later ones are still being generated or synthesized.
+        """
+        if isinstance(text, str):
+            text = _single(text)
+
+        semaphore = asyncio.Semaphore(max_concurrency)
+        tasks: asyncio.Queue = asyncio.Queue()
+
+        async def _synthesize(segment: str) -> bytes:
+            async with semaphore:
+                return await self.generate_audio(segment)
+
+        async def _split():
+            buffer = ""
             try:
-                # Run gTTS in a separate thread to avoid blocking asyncio loop
-                loop = asyncio.get_event_loop()
-                def _gtts_generate():
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as tmp_file:
-                        gtts_path = tmp_file.name
-                    
-                    # Generate slow audio
-                    tts = gTTS(text=clean_text, lang='en')
-                    tts.save(gtts_path)
-                    
-                    # Speed up audio using pydub
-                    try:
-                        from pydub import AudioSegment
-                        audio = AudioSegment.from_mp3(gtts_path)
-                        # Speed up by 1.3x
-                        fast_audio = audio.speedup(playback_speed=1.2)
-                        
-                        # Export to buffer
-                        with tempfile.NamedTemporaryFile(delete=False, suffix=".mp3") as fast_tmp:
-                            fast_path = fast_tmp.name
-                            
-                        fast_audio.export(fast_path, format="mp3")
-                        
-                        with open(fast_path, "rb") as f:
-                            gtts_data = f.read()
-                            
-                        if os.path.exists(fast_path):
-                            os.remove(fast_path)
-                            
-                    except Exception as e_pydub:
-                        print(f"Pydub speedup failed: {e_pydub}. Using normal speed.")
-                        with open(gtts_path, "rb") as f:
-                            gtts_data = f.read()
-
-                    if os.path.exists(gtts_path):
-                        os.remove(gtts_path)
-                    return gtts_data
-                
-                data = await loop.run_in_executor(None, _gtts_generate)
-                print(f"gTTS Success: Generated {len(data)} bytes")
-                return data
-                
-            except Exception as e2:
-                print(f"gTTS fallback failed: {e2}")
-                return b""
+                async for piece in text:
+                    buffer += piece
+                    segments, buffer = split_sentences(buffer, min_chars)
+                    for segment in segments:
+                        tasks.put_nowait(asyncio.ensure_future(_synthesize(segment)))
+                if buffer.strip():
+                    tasks.put_nowait(asyncio.ensure_future(_synthesize(buffer)))
+            finally:
+                tasks.put_nowait(None)
+
+        splitter = asyncio.ensure_future(_split())
+        try:
+            while True:
+                task = await tasks.get()
+                if task is None:
+                    break
+                data = await task
+                if data:
+                    yield data
+            await splitter
+        finally:
+            # Consumer stopped early or failed: don't leave synthesis running
+            splitter.cancel()
+            while not tasks.empty():
+                task = tasks.get_nowait()
+                if task is not None:
+                    task.cancel()
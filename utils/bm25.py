@@ -0,0 +1,112 @@
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+# Keeps identifiers such as "AB-1234", "v2.5" or "part_no" together; a "."
+# only joins when a digit is next to it, so "end.next" stays two words
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:(?:[-_/]|(?<=[0-9])\.|\.(?=[0-9]))[a-z0-9]+)*")
+_PART_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens. A compound identifier is emitted whole, as its
+    parts and with its parts joined ("ab-1234", "ab", "1234", "ab1234"), so
+    it matches however a query spells it, e.g. a transcribed "AB 1234".
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        tokens.append(token)
+        parts = _PART_RE.findall(token)
+        if len(parts) > 1:
+            tokens.extend(parts)
+            tokens.append("".join(parts))
+    return tokens
+
+class BM25Index:
+    """
+    Incremental in-memory inverted index with Okapi BM25 scoring.
+    Documents are added and removed one at a time; nothing is ever rebuilt.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {doc_id: term frequency}
+        self._doc_terms: Dict[str, Tuple[str, ...]] = {}  # doc_id -> unique terms, for removal
+        self._doc_len: Dict[str, int] = {}
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._doc_len)
+
+    def add(self, doc_id: str, text: str):
+        """
+        Adds a document, replacing any previous version with the same ID.
+        """
+        counts = Counter(tokenize(text))
+        with self._lock:
+            self._remove(doc_id)
+            for term, tf in counts.items():
+                self._postings.setdefault(term, {})[doc_id] = tf
+            self._doc_terms[doc_id] = tuple(counts)
+            length = sum(counts.values())
+            self._doc_len[doc_id] = length
+            self._total_len += length
+
+    def remove(self, doc_id: str):
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str):
+        terms = self._doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_len -= self._doc_len.pop(doc_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings.clear()
+            self._doc_terms.clear()
+            self._doc_len.clear()
+            self._total_len = 0
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Returns up to k (doc_id, score) pairs, best first.
+        Only documents sharing at least one term with the query are scored.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_len)
+            if not n_docs or not terms:
+                return []
+            avg_len = self._total_len / n_docs
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._doc_len[doc_id] / avg_len)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    """
+    Merges several best-first ID lists into one using reciprocal-rank fusion:
+    each ID scores sum(1 / (k + rank)) over the lists it appears in.
+    """
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
@@ -0,0 +1,95 @@
+from typing import Dict, List, Optional
+
+# Rough English average for sentence-piece style tokenizers
+CHARS_PER_TOKEN = 4
+# Estimated tokens of one 400-word split_text chunk with its source label
+CHUNK_TOKENS = 650
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+def _overlap_len(prev_words: List[str], next_words: List[str], max_overlap: int) -> int:
+    """
+    Length of the longest suffix of prev_words that is also a prefix of next_words.
+    """
+    for k in range(min(max_overlap, len(prev_words), len(next_words)), 0, -1):
+        if prev_words[-k:] == next_words[:k]:
+            return k
+    return 0
+
+def _truncate(text: str, max_tokens: int) -> str:
+    cut = text[:max_tokens * CHARS_PER_TOKEN]
+    if len(cut) < len(text) and " " in cut:
+        cut = cut.rsplit(" ", 1)[0]
+    return cut
+
+def assemble_context(hits: List[Dict], token_budget: Optional[int] = None, max_overlap: int = 50) -> str:
+    """
+    Builds the prompt context from best-first retrieval hits
+    ({"id", "document", "metadata"} dicts).
+
+    Duplicate chunk text is dropped, then hits are taken in relevance order
+    while their estimated tokens fit token_budget (default: room for every
+    hit at CHUNK_TOKENS each), so a low-ranked hit never displaces a better
+    one. Selected chunks from the same source with consecutive chunk_ids are
+    then merged into one passage with the split_text overlap removed, placed
+    at the rank of its best chunk. Record chunks (metadata with row_start,
+    e.g. CSV rows) are kept verbatim, one passage each, labelled with their
+    row range.
+    """
+    if token_budget is None:
+        token_budget = len(hits) * CHUNK_TOKENS
+
+    # Drop exact duplicates (same text indexed under several names)
+    seen = set()
+    unique = []
+    for rank, hit in enumerate(hits):
+        key = hit["metadata"].get("content_hash") or hit["document"]
+        if key not in seen:
+            seen.add(key)
+            unique.append((rank, hit))
+
+    # Charge the budget per chunk in rank order; merging below only shrinks the total
+    selected = []
+    used = 0
+    for rank, hit in unique:
+        meta = hit["metadata"]
+        source = meta.get("source", "Unknown")
+        label = f"{source}, rows {meta['row_start']}-{meta['row_end']}" if "row_start" in meta else source
+        cost = estimate_tokens(f"[Source: {label}]\n{hit['document']}") + 1
+        if used + cost > token_budget:
+            if selected:
+                continue
+            # Always keep (part of) the most relevant chunk
+            return _truncate(f"[Source: {label}]\n{hit['document']}", token_budget)
+        selected.append((rank, hit, label))
+        used += cost
+
+    passages = []
+    # Group into runs of adjacent chunks per source
+    by_source: Dict[str, List] = {}
+    for rank, hit, label in selected:
+        if "row_start" in hit["metadata"]:
+            passages.append((rank, label, hit["document"]))
+            continue
+        by_source.setdefault(label, []).append((rank, hit))
+
+    for source, items in by_source.items():
+        items.sort(key=lambda item: item[1]["metadata"].get("chunk_id", 0))
+        run_rank, run_words, last_id = None, None, None
+        for rank, hit in items:
+            chunk_id = hit["metadata"].get("chunk_id")
+            words = hit["document"].split()
+            if run_words is not None and chunk_id is not None and last_id is not None and chunk_id == last_id + 1:
+                run_words.extend(words[_overlap_len(run_words, words, max_overlap):])
+                run_rank = min(run_rank, rank)
+            else:
+                if run_words is not None:
+                    passages.append((run_rank, source, " ".join(run_words)))
+                run_rank, run_words = rank, words
+            last_id = chunk_id
+        if run_words is not None:
+            passages.append((run_rank, source, " ".join(run_words)))
+
+    passages.sort(key=lambda passage: passage[0])
+    return "\n\n".join(f"[Source: {source}]\n{text}" for _, source, text in passages)
@@ -0,0 +1,214 @@
+import platform
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings, Space
+
+# "torch" is the full-precision reference; "onnx" runs the same weights on
+# ONNX Runtime and "onnx-int8" a dynamically quantized export of them.
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def _int8_model_file() -> str:
+    # Quantized exports published with the sentence-transformers models
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+class TorchEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    SentenceTransformer on PyTorch with a configurable encode batch size and
+    thread count (threads applies process-wide to torch).
+
+    It registers under the name and config format of chromadb's own
+    SentenceTransformerEmbeddingFunction, so collections created with that
+    class open unchanged.
+    """
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", threads: int = 0, batch_size: int = 32,
+                 device: str = "cpu", normalize_embeddings: bool = False):
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.threads = threads
+        self.batch_size = batch_size
+        self.device = device
+        self.normalize_embeddings = normalize_embeddings
+        self._model = SentenceTransformer(model_name, device=device)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        embeddings = self._model.encode(
+            list(input),
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize_embeddings,
+        )
+        return [np.array(embedding, dtype=np.float32) for embedding in embeddings]
+
+    @staticmethod
+    def name() -> str:
+        return "sentence_transformer"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "device": self.device,
+            "normalize_embeddings": self.normalize_embeddings,
+            "kwargs": {},
+        }
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "TorchEmbeddingFunction":
+        return TorchEmbeddingFunction(
+            model_name=config["model_name"],
+            device=config.get("device", "cpu"),
+            normalize_embeddings=config.get("normalize_embeddings", False),
+        )
+
+    def default_space(self) -> Space:
+        return "cosine"
+
+    def supported_spaces(self) -> List[Space]:
+        return ["cosine", "l2", "ip"]
+
+class OnnxEmbeddingFunction(EmbeddingFunction[Documents]):
+    """
+    Sentence embeddings on ONNX Runtime (CPU), mean-pooled and normalized
+    like SentenceTransformer. The model file and tokenizer are fetched from
+    the Hugging Face hub on first use. Batches are padded to their longest
+    text rather than a fixed length, so short queries stay cheap.
+    """
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", quantized: bool = False, threads: int = 0,
+                 batch_size: int = 32, max_length: int = 256, model_file: Optional[str] = None):
+        """
+        Args:
+            quantized: Use the int8 export instead of the float32 one.
+            threads: ONNX Runtime intra-op threads (0 = one per core).
+            batch_size: Texts per inference call.
+            max_length: Token limit per text; longer texts are truncated.
+            model_file: Override the file within the hub repo to load.
+        """
+        self.model_name = model_name
+        self.quantized = quantized
+        self.threads = threads
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.model_file = model_file or (_int8_model_file() if quantized else "onnx/model.onnx")
+        self._session = None
+        self._tokenizer = None
+
+    def _repo_id(self) -> str:
+        return self.model_name if "/" in self.model_name else f"sentence-transformers/{self.model_name}"
+
+    def _load(self):
+        import onnxruntime as ort
+        from huggingface_hub import hf_hub_download
+        from tokenizers import Tokenizer
+
+        tokenizer = Tokenizer.from_file(hf_hub_download(self._repo_id(), "tokenizer.json"))
+        tokenizer.enable_truncation(max_length=self.max_length)
+        tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.log_severity_level = 3
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = self.threads
+        session = ort.InferenceSession(
+            hf_hub_download(self._repo_id(), self.model_file),
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {i.name for i in session.get_inputs()}
+        self._tokenizer, self._session = tokenizer, session
+
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        encoded = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([e.ids for e in encoded], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encoded], dtype=np.int64)
+        feed = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self._input_names:
+            feed["token_type_ids"] = np.zeros_like(input_ids)
+        hidden = self._session.run(None, feed)[0]
+
+        mask = attention_mask[:, :, None].astype(np.float32)
+        pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        if self._session is None:
+            self._load()
+        texts = list(input)
+        embeddings = []
+        for i in range(0, len(texts), self.batch_size):
+            embeddings.extend(self._forward(texts[i:i + self.batch_size]).astype(np.float32))
+        return embeddings
+
+    @staticmethod
+    def name() -> str:
+        return "genova_onnx"
+
+    def get_config(self) -> Dict[str, Any]:
+        return {
+            "model_name": self.model_name,
+            "quantized": self.quantized,
+            "threads": self.threads,
+            "batch_size": self.batch_size,
+            "max_length": self.max_length,
+            "model_file": self.model_file,
+        }
+
+    @staticmethod
+    def build_from_config(config: Dict[str, Any]) -> "OnnxEmbeddingFunction":
+        return OnnxEmbeddingFunction(**config)
+
+def create_embedding_function(backend: str = "torch", model_name: str = "all-MiniLM-L6-v2",
+                              threads: int = 0, batch_size: int = 32) -> EmbeddingFunction:
+    """
+    Builds the embedding function for one of EMBEDDING_BACKENDS.
+    """
+    if backend == "torch":
+        return TorchEmbeddingFunction(model_name, threads=threads, batch_size=batch_size)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddingFunction(model_name, quantized=backend == "onnx-int8",
+                                     threads=threads, batch_size=batch_size)
+    raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(EMBEDDING_BACKENDS)})")
+
+def _top_k(corpus: np.ndarray, queries: np.ndarray, k: int) -> List[set]:
+    scores = queries @ corpus.T
+    return [set(np.argsort(-row)[:k]) for row in scores]
+
+def _normalized(embeddings) -> np.ndarray:
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    return matrix / np.clip(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12, None)
+
+def recall_drift(reference: Callable[[List[str]], Sequence], candidate: Callable[[List[str]], Sequence],
+                 corpus: List[str], queries: List[str], k: int = 5) -> Dict[str, float]:
+    """
+    Measures how far a candidate backend drifts from the reference model.
+
+    Both embed the corpus and queries; recall_at_k is the average share of
+    the reference's top-k corpus hits per query that the candidate also
+    ranks in its top-k (1.0 means identical retrieval). mean_cosine is the
+    average similarity between the two embeddings of the same text.
+    """
+    k = min(k, len(corpus))
+    ref_corpus, cand_corpus = _normalized(reference(corpus)), _normalized(candidate(corpus))
+    ref_queries, cand_queries = _normalized(reference(queries)), _normalized(candidate(queries))
+
+    expected = _top_k(ref_corpus, ref_queries, k)
+    actual = _top_k(cand_corpus, cand_queries, k)
+    recall = float(np.mean([len(e & a) / k for e, a in zip(expected, actual)]))
+    paired = np.concatenate([(ref_corpus * cand_corpus).sum(axis=1), (ref_queries * cand_queries).sum(axis=1)])
+    return {"recall_at_k": recall, "k": k, "mean_cosine": float(paired.mean())}
+
+def measure_throughput(embedding_fn: Callable[[List[str]], Sequence], texts: List[str]) -> float:
+    """
+    Returns texts embedded per second (after one warm-up call).
+    """
+    embedding_fn(texts[:1])
+    started = time.perf_counter()
+    embedding_fn(texts)
+    return len(texts) / (time.perf_counter() - started)
@@ -0,0 +1,118 @@
+import base64
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from urllib.parse import quote
+
+from utils.stt_service import ServiceOverloaded, TranscriptionResult
+
+class EngineError(RuntimeError):
+    """
+    Raised when the engine server answers with an error.
+    """
+
+class EngineClient:
+    """
+    Client for server.py with the same methods as utils.pipeline.Pipeline,
+    so the Streamlit app can drive a remote engine instead of loading the
+    models itself (ENGINE_URL). Document uploads report progress and
+    answers stream as newline-delimited JSON events.
+    """
+    def __init__(self, base_url: str, timeout: float = 120.0):
+        import httpx
+
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self._httpx = httpx
+        self._http = httpx.Client(base_url=self.base_url, timeout=timeout)
+
+    @staticmethod
+    def _check(response):
+        if response.is_error:
+            if response.status_code == 503:
+                raise ServiceOverloaded(response.json().get("detail", "Engine is busy"))
+            raise EngineError(f"Engine returned {response.status_code}: {response.text}")
+        return response
+
+    def _get(self, path: str) -> Any:
+        return self._check(self._http.get(path)).json()
+
+    @staticmethod
+    def _namespace_path(namespace: str) -> str:
+        return f"/namespaces/{quote(namespace, safe='')}"
+
+    def start_warm_up(self):
+        # The server warms its own components up at start
+        pass
+
+    def timings(self) -> List[Dict[str, Any]]:
+        return self._get("/health")["timings"]
+
+    def metrics(self) -> Dict[str, Any]:
+        return self._get("/metrics.json")
+
+    # --- Documents ---
+
+    def evict_idle(self) -> List[str]:
+        # The server evicts idle namespaces on its own schedule
+        return []
+
+    def indexed_sources(self, namespace: str) -> Dict[str, str]:
+        return self._get(self._namespace_path(namespace))["sources"]
+
+    def corpus_version(self, namespace: str) -> int:
+        return self._get(self._namespace_path(namespace))["version"]
+
+    def clear(self, namespace: str):
+        self._check(self._http.delete(self._namespace_path(namespace)))
+
+    def index_upload(self, name: str, data: bytes, namespace: str,
+                     progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+                     file_hash: Optional[str] = None) -> int:
+        params = {"hash": file_hash} if file_hash else {}
+        path = f"{self._namespace_path(namespace)}/documents/{quote(name, safe='')}"
+        with self._http.stream("PUT", path, content=data, params=params) as response:
+            if response.is_error:
+                response.read()
+                self._check(response)
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event["type"] == "progress" and progress_callback:
+                    progress_callback(event["done"], event["total"])
+                elif event["type"] == "indexed":
+                    return event["embedded"]
+                elif event["type"] == "error":
+                    raise EngineError(event["message"])
+        raise EngineError(f"Engine closed the upload of {name} without a result")
+
+    # --- Speech ---
+
+    def transcribe(self, audio_bytes: bytes, latency_profile: Optional[str] = None,
+                   timeout: Optional[float] = 120) -> TranscriptionResult:
+        params = {"profile": latency_profile} if latency_profile else {}
+        response = self._http.post("/transcribe", content=audio_bytes, params=params,
+                                   timeout=timeout or self.timeout)
+        return TranscriptionResult(**self._check(response).json())
+
+    # --- Answers ---
+
+    async def answer(self, question: str, namespace: str, with_audio: bool = True,
+                     is_audio: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Same events as Pipeline.answer; audio arrives base64-encoded and is
+        decoded back to bytes.
+        """
+        payload = {"question": question, "namespace": namespace, "with_audio": with_audio, "is_audio": is_audio}
+        async with self._httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout) as client:
+            async with client.stream("POST", "/chat", json=payload) as response:
+                if response.is_error:
+                    await response.aread()
+                    self._check(response)
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "audio":
+                        event["data"] = base64.b64decode(event["data"])
+                    yield event
@@ -0,0 +1,85 @@
+import itertools
+import random
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional, Union
+
+class FakeServiceUnavailable(Exception):
+    """
+    Stand-in for a transient upstream error (HTTP 503).
+    """
+    code = 503
+
+class FakeInvalidArgument(Exception):
+    """
+    Stand-in for a permanent upstream error (HTTP 400).
+    """
+    code = 400
+
+class _FakeChunk:
+    def __init__(self, text: str):
+        self.text = text
+        self.candidates = []
+        self.prompt_feedback = None
+
+class FakeGenerativeModel:
+    """
+    Offline stand-in for google.generativeai.GenerativeModel, for exercising
+    GeminiLLM's deadlines, retries and hedging without network access:
+
+        llm = GeminiLLM(api_key="", model_client=FakeGenerativeModel(latency=[0.1, 5.0]))
+
+    Each call takes the next latency (seconds; a sequence cycles, a float is
+    fixed) and fails with the next entry of failures (None = succeed) until
+    the list is used up. The latency is spent before the response (or the
+    first stream chunk); stream chunks are chunk_delay apart. A call never
+    blocks longer than its request_options timeout, like the real client.
+    """
+    def __init__(self, reply: str = "This is a fake answer. It is streamed in several chunks.",
+                 latency: Union[float, Iterable[float]] = 0.0, chunk_delay: float = 0.0,
+                 failures: Optional[List[Optional[BaseException]]] = None, jitter: float = 0.0,
+                 seed: int = 0):
+        self.reply = reply
+        self._latencies = itertools.cycle([latency] if isinstance(latency, (int, float)) else list(latency))
+        self.chunk_delay = chunk_delay
+        self._failures = list(failures or [])
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def _next_call(self):
+        with self._lock:
+            self.calls += 1
+            latency = next(self._latencies) + self._rng.uniform(0, self.jitter)
+            failure = self._failures.pop(0) if self._failures else None
+        return latency, failure
+
+    @staticmethod
+    def _wait(seconds: float, request_options: Optional[dict]):
+        timeout = (request_options or {}).get("timeout")
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"fake request exceeded its {timeout:.1f}s timeout")
+        time.sleep(seconds)
+
+    def _chunks(self) -> List[str]:
+        words = self.reply.split(" ")
+        return [" ".join(words[i:i + 4]) + (" " if i + 4 < len(words) else "") for i in range(0, len(words), 4)]
+
+    def _stream(self, latency: float, request_options: Optional[dict]) -> Iterator[_FakeChunk]:
+        self._wait(latency, request_options)
+        for i, text in enumerate(self._chunks()):
+            if i:
+                time.sleep(self.chunk_delay)
+            yield _FakeChunk(text)
+
+    def generate_content(self, contents=None, stream: bool = False, request_options: Optional[dict] = None, **kwargs):
+        latency, failure = self._next_call()
+        if failure is not None:
+            self._wait(latency, request_options)
+            raise failure
+        if stream:
+            return self._stream(latency, request_options)
+        self._wait(latency, request_options)
+        return _FakeChunk(self.reply)
@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from typing import List, Optional
+
+from utils.audio import AudioStreamer
+
+class FakeAudioStreamer(AudioStreamer):
+    """
+    Offline AudioStreamer: the Edge TTS and gTTS calls are replaced with
+    sleeps and deterministic fake MP3 bytes, while cleaning, caching, the
+    circuit breaker and the pipelined stream_audio are the real code.
+
+        streamer = FakeAudioStreamer(edge_latency=0.2, cache_memory_bytes=0)
+
+    Synthesis takes base latency plus per_char seconds per character (plus
+    up to jitter); edge_failures works like FakeGenerativeModel's failures,
+    one entry per Edge call, so the gTTS fallback can be exercised too.
+    Returned audio is bytes_per_char bytes per character of text.
+    """
+    def __init__(self, edge_latency: float = 0.15, gtts_latency: float = 0.4, per_char: float = 0.001,
+                 jitter: float = 0.0, edge_failures: Optional[List[Optional[BaseException]]] = None,
+                 bytes_per_char: int = 200, seed: int = 0, **kwargs):
+        super().__init__(**kwargs)
+        self.edge_latency = edge_latency
+        self.gtts_latency = gtts_latency
+        self.per_char = per_char
+        self.jitter = jitter
+        self.bytes_per_char = bytes_per_char
+        self._edge_failures = list(edge_failures or [])
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.edge_calls = 0
+        self.gtts_calls = 0
+
+    def preload(self):
+        pass
+
+    def _latency(self, base: float, text: str) -> float:
+        with self._lock:
+            return base + self.per_char * len(text) + self._rng.uniform(0, self.jitter)
+
+    def _audio(self, text: str) -> bytes:
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        size = max(1, len(text) * self.bytes_per_char)
+        return (digest * (size // len(digest) + 1))[:size]
+
+    async def _edge_synthesize(self, text: str) -> bytes:
+        with self._lock:
+            self.edge_calls += 1
+            failure = self._edge_failures.pop(0) if self._edge_failures else None
+        await asyncio.sleep(self._latency(self.edge_latency, text))
+        if failure is not None:
+            raise failure
+        return self._audio(text)
+
+    def _gtts_synthesize(self, text: str) -> bytes:
+        # Runs in an executor thread, like the real gTTS call
+        with self._lock:
+            self.gtts_calls += 1
+        time.sleep(self._latency(self.gtts_latency, text))
+        return self._audio(text)
@@ -0,0 +1,168 @@
+import csv
+import io
+import itertools
+import multiprocessing
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# PDFs shorter than this are extracted inline. Text pages take roughly 3-30 ms
+# each with PyPDF2 and every task re-opens the file in a worker, so below
+# ~64 pages the hand-off costs about as much as it saves
+PARALLEL_PDF_MIN_PAGES = 64
+PAGES_PER_TASK = 8
+PDF_WORKERS = min(os.cpu_count() or 1, 4)
+
+# One process pool shared by all uploads, started on the first large PDF
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+# (file, reader) pairs opened in a pool worker, by path; only the most recent few are kept
+_worker_readers: OrderedDict = OrderedDict()
+_WORKER_READERS = 2
+
+def _extract_page_range(path: str, start: int, end: int) -> List[str]:
+    entry = _worker_readers.get(path)
+    if entry is None:
+        import PyPDF2
+        # Given an open file, PyPDF2 seeks to objects as needed instead of reading it all
+        handle = open(path, "rb")
+        entry = _worker_readers[path] = (handle, PyPDF2.PdfReader(handle))
+        while len(_worker_readers) > _WORKER_READERS:
+            _worker_readers.popitem(last=False)[1][0].close()
+    _worker_readers.move_to_end(path)
+    reader = entry[1]
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # spawn, not fork: the Streamlit server process is multi-threaded
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+def _reset_pdf_pool(pool: ProcessPoolExecutor):
+    # A worker died; the next large PDF starts a fresh pool
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is pool:
+            _pdf_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def iter_pdf_pages(data: bytes, workers: Optional[int] = None) -> Iterator[str]:
+    """
+    Yields the text of each PDF page in order.
+    Large PDFs are extracted in parallel on a process pool shared by all
+    uploads. Workers read the file from a temporary copy on disk rather than
+    receiving its bytes, and only a few page ranges are in flight per upload,
+    so memory stays bounded however many uploads run at once.
+    """
+    import PyPDF2
+    reader = PyPDF2.PdfReader(io.BytesIO(data))
+    n_pages = len(reader.pages)
+    workers = workers or PDF_WORKERS
+
+    if n_pages < PARALLEL_PDF_MIN_PAGES or workers == 1:
+        for page in reader.pages:
+            yield page.extract_text() or ""
+        return
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as tmp:
+        tmp.write(data)
+    pool = _get_pdf_pool()
+    ranges = ((start, min(start + PAGES_PER_TASK, n_pages)) for start in range(0, n_pages, PAGES_PER_TASK))
+    pending = deque()
+    try:
+        pending.extend(pool.submit(_extract_page_range, tmp.name, *r) for r in itertools.islice(ranges, workers * 2))
+        while pending:
+            pages = pending.popleft().result()
+            nxt = next(ranges, None)
+            if nxt:
+                pending.append(pool.submit(_extract_page_range, tmp.name, *nxt))
+            yield from pages
+    except BrokenProcessPool:
+        _reset_pdf_pool(pool)
+        raise
+    finally:
+        # Abandoned generator or error: don't leave ranges queued for a deleted file
+        for future in pending:
+            future.cancel()
+        try:
+            os.unlink(tmp.name)
+        except OSError:
+            pass
+
+def iter_text_lines(data: bytes) -> Iterator[str]:
+    """
+    Yields decoded lines of a UTF-8 text file.
+    """
+    yield from io.TextIOWrapper(io.BytesIO(data), encoding="utf-8")
+
+def iter_docx_paragraphs(data: bytes) -> Iterator[str]:
+    """
+    Yields the text of each DOCX paragraph.
+    """
+    import docx
+    doc = docx.Document(io.BytesIO(data))
+    for para in doc.paragraphs:
+        yield para.text
+
+def _csv_line(row: List[str]) -> str:
+    # One line per record: whitespace (including newlines) inside cells is collapsed
+    out = io.StringIO()
+    csv.writer(out, lineterminator="").writerow([" ".join(cell.split()) for cell in row])
+    return out.getvalue()
+
+def iter_csv_chunks(data: bytes, chunk_words: int = 400) -> Iterator[Tuple[str, Dict]]:
+    """
+    Streams a UTF-8 CSV file as record chunks: whole rows are grouped until a
+    chunk reaches about chunk_words words, and every chunk starts with the
+    header row so it reads on its own. Yields (text, metadata) pairs where
+    metadata holds the 1-based data row range (row_start, row_end). A row is
+    never split, so one longer than chunk_words becomes its own chunk.
+    """
+    reader = csv.reader(io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline=""))
+    header = next(reader, None)
+    if header is None:
+        return
+    header_line = _csv_line(header)
+    header_words = len(header_line.split())
+
+    lines: List[str] = []
+    words = header_words
+    row_start = row_end = 0
+    for row_number, row in enumerate(reader, start=1):
+        if not any(cell.strip() for cell in row):
+            continue
+        line = _csv_line(row)
+        line_words = len(line.split())
+        if lines and words + line_words > chunk_words:
+            yield "\n".join([header_line] + lines), {"row_start": row_start, "row_end": row_end}
+            lines, words = [], header_words
+        if not lines:
+            row_start = row_number
+        lines.append(line)
+        words += line_words
+        row_end = row_number
+    if lines:
+        yield "\n".join([header_line] + lines), {"row_start": row_start, "row_end": row_end}
+
+def extract_segments(data: bytes, filename: str) -> Iterator[str]:
+    """
+    Returns a generator of text segments (pages, lines or paragraphs) for an
+    uploaded file, picked by its extension. CSV files are chunked by record
+    instead; see iter_csv_chunks.
+    """
+    if filename.endswith('.pdf'):
+        return iter_pdf_pages(data)
+    elif filename.endswith('.txt'):
+        return iter_text_lines(data)
+    elif filename.endswith('.docx'):
+        return iter_docx_paragraphs(data)
+    raise ValueError(f"Unsupported file type: {filename}")
@@ -0,0 +1,95 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+class LazyComponent:
+    """
+    Builds an expensive object on first use and forwards attribute access
+    to it, so callers use the proxy as if it were the object itself.
+
+    Construction is guarded by a lock: if the background warm-up is already
+    loading the component, a first use simply waits for it. A failed build
+    is re-raised to the caller and retried on the next use. An instance
+    that later reports itself `failed` (e.g. a worker pool none of whose
+    models could load) is discarded and rebuilt on the next use too.
+    """
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+        self.load_seconds: Optional[float] = None
+        self.loaded_by: Optional[str] = None  # "warm-up" or "first use"
+
+    @property
+    def loaded(self) -> bool:
+        return self._instance is not None
+
+    def _usable(self) -> bool:
+        return self._instance is not None and not getattr(self._instance, "failed", False)
+
+    def get(self, loaded_by: str = "first use") -> Any:
+        if not self._usable():
+            with self._lock:
+                if not self._usable():
+                    if self._instance is not None:
+                        print(f"Rebuilding {self.name}: the previous instance failed")
+                    started = time.perf_counter()
+                    instance = self._factory()
+                    self.load_seconds = time.perf_counter() - started
+                    self.loaded_by = loaded_by
+                    self._instance = instance
+                    print(f"Loaded {self.name} in {self.load_seconds:.2f}s ({loaded_by})")
+        return self._instance
+
+    def __getattr__(self, attr: str) -> Any:
+        # Only called for attributes not defined on the proxy itself
+        if attr.startswith("_"):
+            raise AttributeError(attr)
+        return getattr(self.get(), attr)
+
+class ComponentRegistry:
+    """
+    Named lazy components plus an optional background warm-up thread that
+    loads them in registration order once the UI is up.
+    """
+    def __init__(self, factories: Dict[str, Callable[[], Any]]):
+        self.components = {name: LazyComponent(name, factory) for name, factory in factories.items()}
+        self._warm_up_thread: Optional[threading.Thread] = None
+        self.warm_up_errors: Dict[str, str] = {}
+
+    def __getitem__(self, name: str) -> LazyComponent:
+        return self.components[name]
+
+    def start_warm_up(self):
+        """
+        Starts the warm-up thread; later calls do nothing.
+        """
+        if self._warm_up_thread is not None:
+            return
+        self._warm_up_thread = threading.Thread(target=self._warm_up, name="warm-up", daemon=True)
+        self._warm_up_thread.start()
+
+    def _warm_up(self):
+        for name, component in self.components.items():
+            try:
+                component.get(loaded_by="warm-up")
+            except Exception as e:
+                self.warm_up_errors[name] = str(e)
+                print(f"Warm-up of {name} failed: {e}")
+
+    def timings(self) -> List[Dict[str, Any]]:
+        """
+        Per-component startup breakdown: load time, what triggered the load
+        and any warm-up error.
+        """
+        return [
+            {
+                "component": name,
+                "loaded": component.loaded,
+                "load_seconds": component.load_seconds,
+                "loaded_by": component.loaded_by,
+                "error": self.warm_up_errors.get(name),
+            }
+            for name, component in self.components.items()
+        ]
@@ -1,21 +1,111 @@
 # utils/llm.py
 import asyncio
-from typing import Optional
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
 
-try:
-    import google.generativeai as genai
-except Exception:
-    genai = None
+from utils.resilience import DeadlineExceeded, LatencyTracker, RetryPolicy
+from utils.tracing import tracer
+
+SAFETY_REFUSAL = "I cannot answer this question because it violates safety policies."
+NO_RESPONSE = "I could not generate a response. Please try again."
+ERROR_PREFIX = "Error generating response"
+# Threads per client for Gemini attempts, hedged duplicates included
+ATTEMPT_THREADS = 32
+
+def _candidate_text(resp) -> Optional[str]:
+    """
+    Fallback parsing for complex responses: first text part of the first candidate.
+    """
+    if hasattr(resp, 'candidates') and resp.candidates:
+        c = resp.candidates[0]
+        if hasattr(c, 'content') and c.content:
+            if hasattr(c.content, 'parts') and c.content.parts:
+                return c.content.parts[0].text
+    return None
+
+def _response_text(resp) -> str:
+    """
+    Text of a complete (non-streamed) response, or the refusal / no-response message.
+    """
+    # Checking for safety ratings or other blocks if text is not available
+    try:
+        if resp.text:
+            return resp.text
+    except ValueError:
+        print(f"Response blocked. Safety ratings: {resp.prompt_feedback}")
+        return SAFETY_REFUSAL
+
+    # Fallback parsing for complex responses
+    text = _candidate_text(resp)
+    if text:
+        return text
+    return NO_RESPONSE
+
+def _quantile(values, q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
 
 class GeminiLLM:
-    def __init__(self, api_key: str, model: str = "text-bison-001"):
-        if not genai:
-            raise RuntimeError("google-generativeai library not installed. pip install google-generativeai")
+    def __init__(self, api_key: str, model: str = "text-bison-001", timeout: float = 30.0,
+                 idle_timeout: float = 20.0, retry: Optional[RetryPolicy] = None,
+                 hedge_percentile: Optional[float] = 0.95, model_client: Any = None):
+        """
+        Args:
+            timeout: Deadline in seconds, across all attempts, for a complete
+                answer (generate) or for the first chunk of a stream.
+            idle_timeout: Longest gap allowed between chunks of a stream.
+            retry: Retry policy for transient errors (default: 3 attempts with
+                jittered exponential backoff).
+            hedge_percentile: If an attempt is still unanswered after this
+                latency quantile of recent calls, a duplicate request is
+                started and whichever answers first wins. None disables hedging.
+            model_client: Object with GenerativeModel's generate_content
+                interface used instead of the SDK, e.g. utils.fake_llm.FakeGenerativeModel.
+        """
         self.api_key = api_key
         self.model = model
-        genai.configure(api_key=api_key)
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.retry = retry or RetryPolicy()
+        self.hedge_percentile = hedge_percentile
+        self._genai = None
+        if model_client is None:
+            # Imported here rather than at module load: the SDK is slow to import
+            try:
+                import google.generativeai as genai
+            except Exception:
+                raise RuntimeError("google-generativeai library not installed. pip install google-generativeai")
+            self._genai = genai
+            genai.configure(api_key=api_key)
+        self._model_obj = model_client
+        self._model_lock = threading.Lock()
+        # Attempts run on threads owned by this client rather than the loop's
+        # default executor: asyncio.run waits for the default executor's
+        # threads, so a losing hedge or abandoned attempt would hold up the turn
+        self._executor = ThreadPoolExecutor(max_workers=ATTEMPT_THREADS, thread_name_prefix="gemini")
 
-    async def generate(self, prompt: str, pdf_context: Optional[str] = None) -> str:
+        # Per-attempt latency of complete answers and of first stream chunks;
+        # their percentiles set the hedging delay
+        self.latency = LatencyTracker()
+        self.first_chunk_latency = LatencyTracker()
+        self._calls = deque(maxlen=200)
+
+    def _get_model(self):
+        """
+        Returns the GenerativeModel, built once and reused across calls.
+        """
+        if self._model_obj is None:
+            with self._model_lock:
+                if self._model_obj is None:
+                    self._model_obj = self._genai.GenerativeModel(self.model)
+        return self._model_obj
+
+    def _build_prompt(self, prompt: str, pdf_context: Optional[str] = None) -> str:
         # If PDF context is provided, prepend it to the prompt
         if pdf_context:
             system_message = f"""You are a helpful assistant. Below is content from uploaded documents. Please use this content to answer the user's questions accurately.
@@ -32,43 +122,254 @@ User Question: {prompt}"""
             effective_prompt = system_message
         else:
             effective_prompt = prompt
-        
-        loop = asyncio.get_event_loop()
-        def _call():
+        return effective_prompt
+
+    def _request(self, effective_prompt: str, stream: bool, request_timeout: float):
+        # The SDK-level timeout stops an abandoned attempt from holding its thread forever
+        return self._get_model().generate_content(
+            contents=[{"parts": [{"text": effective_prompt}]}],
+            stream=stream,
+            request_options={"timeout": request_timeout}
+        )
+
+    async def _hedged(self, start: Callable[[float], Tuple[Awaitable, Callable[[], None]]], deadline: float,
+                      tracker: LatencyTracker, stats: Dict[str, Any]) -> Any:
+        """
+        Runs one attempt, started by start(request_timeout) -> (awaitable, abandon).
+        If it is still pending after the tracker's hedge_percentile latency, a
+        second copy is started; the first to succeed wins and the other is
+        abandoned. A failed copy does not end the attempt while the other is
+        still running. Raises DeadlineExceeded at the deadline.
+        """
+        loop = asyncio.get_running_loop()
+        running: Dict[asyncio.Future, Tuple[float, Callable[[], None]]] = {}
+
+        def launch():
+            started = loop.time()
+            awaitable, abandon = start(max(deadline - started, 0.1))
+            future = asyncio.ensure_future(awaitable)
+            # Losers may still fail after we stop listening; don't log that
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+            running[future] = (started, abandon)
+            stats["attempts"] += 1
+            return started
+
+        def abandon_all():
+            for future, (_, abandon) in running.items():
+                abandon()
+                future.cancel()
+
+        first_started = launch()
+        hedge_after = tracker.percentile(self.hedge_percentile) if self.hedge_percentile else None
+        error = None
+        while running:
+            wait = deadline - loop.time()
+            if hedge_after is not None and not stats["hedged"]:
+                wait = min(wait, first_started + hedge_after - loop.time())
+            done, _ = await asyncio.wait(list(running), timeout=max(wait, 0), return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                started, _ = running.pop(future)
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                tracker.record(loop.time() - started)
+                abandon_all()
+                return future.result()
+            if done:
+                continue
+            if loop.time() >= deadline:
+                abandon_all()
+                raise DeadlineExceeded(f"no response within {self.timeout:g}s")
+            if hedge_after is not None and not stats["hedged"]:
+                stats["hedged"] = True
+                launch()
+        raise error
+
+    async def _with_retries(self, start, tracker: LatencyTracker, stats: Dict[str, Any]) -> Any:
+        """
+        Runs hedged attempts until one succeeds, the error is not retryable,
+        the attempts run out or the deadline passes, sleeping with jittered
+        backoff in between.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        for retry in range(self.retry.max_attempts):
             try:
-                
-                model_obj = genai.GenerativeModel(self.model)
-                resp = model_obj.generate_content(contents=[{"parts": [{"text": effective_prompt}]}], stream=False)
-                
-                # Checking for safety ratings or other blocks if text is not available
+                return await self._hedged(start, deadline, tracker, stats)
+            except Exception as e:
+                remaining = deadline - loop.time()
+                if retry == self.retry.max_attempts - 1 or remaining <= 0 or not self.retry.retryable(e):
+                    raise
+                print(f"LLM attempt failed ({e}); retrying")
+                await asyncio.sleep(min(self.retry.delay(retry), remaining))
+
+    def _record_call(self, kind: str, started: float, stats: Dict[str, Any], outcome: str,
+                     prompt_chars: int, response_chars: int = 0, first_chunk: Optional[float] = None):
+        latency = time.monotonic() - started
+        self._calls.append({"kind": kind, "latency": latency, "first_chunk": first_chunk,
+                            "attempts": stats["attempts"], "hedged": stats["hedged"], "outcome": outcome})
+        attrs = {"prompt_chars": prompt_chars, "response_chars": response_chars,
+                 "attempts": stats["attempts"], "hedged": stats["hedged"], "outcome": outcome}
+        if outcome != "ok":
+            attrs["error"] = outcome
+        tracer.record(f"llm.{kind}", latency, **attrs)
+        if first_chunk is not None:
+            tracer.record("llm.first_chunk", first_chunk)
+        print(f"LLM {kind}: {outcome} in {latency:.2f}s after {stats['attempts']} attempt(s)"
+              f"{' (hedged)' if stats['hedged'] else ''}")
+
+    def metrics(self) -> Dict[str, Any]:
+        """
+        Latency percentiles, attempts, hedge rate and outcomes over the last 200 calls.
+        """
+        calls = list(self._calls)
+        latencies = [c["latency"] for c in calls]
+        first_chunks = [c["first_chunk"] for c in calls if c["first_chunk"] is not None]
+        outcomes: Dict[str, int] = {}
+        for c in calls:
+            outcomes[c["outcome"]] = outcomes.get(c["outcome"], 0) + 1
+        return {
+            "calls": len(calls),
+            "p50": _quantile(latencies, 0.50),
+            "p95": _quantile(latencies, 0.95),
+            "p99": _quantile(latencies, 0.99),
+            "first_chunk_p50": _quantile(first_chunks, 0.50),
+            "first_chunk_p95": _quantile(first_chunks, 0.95),
+            "avg_attempts": sum(c["attempts"] for c in calls) / len(calls) if calls else 0.0,
+            "hedge_rate": sum(c["hedged"] for c in calls) / len(calls) if calls else 0.0,
+            "outcomes": outcomes,
+        }
+
+    async def generate(self, prompt: str, pdf_context: Optional[str] = None) -> str:
+        """
+        Returns the complete answer. Transient failures are retried and slow
+        attempts hedged within the deadline; a final failure is returned as
+        an ERROR_PREFIX message.
+        """
+        effective_prompt = self._build_prompt(prompt, pdf_context)
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        stats = {"attempts": 0, "hedged": False}
+
+        def start(request_timeout):
+            attempt = loop.run_in_executor(self._executor, self._request, effective_prompt, False, request_timeout)
+            return attempt, lambda: None
+
+        try:
+            resp = await self._with_retries(start, self.latency, stats)
+            text = await loop.run_in_executor(self._executor, _response_text, resp)
+        except Exception as e:
+            print(f"LLM Generation Error: {e}")
+            self._record_call("generate", started, stats, "timeout" if isinstance(e, TimeoutError) else "error",
+                              len(effective_prompt))
+            return f"{ERROR_PREFIX}: {str(e)}"
+        self._record_call("generate", started, stats, "ok", len(effective_prompt), len(text))
+        return text
+
+    def _stream_worker(self, effective_prompt: str, request_timeout: float, emit: Callable, cancel: threading.Event):
+        """
+        Runs one streaming attempt in a worker thread, emitting ("chunk", text),
+        ("text", message) for refusals / empty answers, ("error", exc) and ("end", None).
+        Stops quietly once cancel is set.
+        """
+        yielded = False
+        blocked = False
+        try:
+            resp = self._request(effective_prompt, True, request_timeout)
+            for chunk in resp:
+                if cancel.is_set():
+                    return
+                # .text raises ValueError when a chunk has no text parts (e.g. safety stop)
                 try:
-                    if resp.text:
-                        return resp.text
+                    text = chunk.text
                 except ValueError:
-                    
-                    print(f"Response blocked. Safety ratings: {resp.prompt_feedback}")
-                    return "I cannot answer this question because it violates safety policies."
-                
-                # Fallback parsing for complex responses
-                if hasattr(resp, 'candidates') and resp.candidates:
-                    c = resp.candidates[0]
-                    if hasattr(c, 'content') and c.content:
-                        if hasattr(c.content, 'parts') and c.content.parts:
-                            return c.content.parts[0].text
-                            
-                return "I could not generate a response. Please try again."
+                    text = _candidate_text(chunk)
+                    if not text:
+                        blocked = True
+                        break
+                if text:
+                    yielded = True
+                    emit(("chunk", text))
 
-            except Exception as e:
-                print(f"LLM Generation Error: {e}")
-                return f"Error generating response: {str(e)}"
-        return await loop.run_in_executor(None, _call)
+            if not yielded:
+                if blocked:
+                    print(f"Response blocked. Safety ratings: {getattr(resp, 'prompt_feedback', None)}")
+                    emit(("text", SAFETY_REFUSAL))
+                else:
+                    emit(("text", NO_RESPONSE))
+            emit(("end", None))
+        except Exception as e:
+            emit(("error", e))
+
+    async def generate_stream(self, prompt: str, pdf_context: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Async generator yielding response text as Gemini streams it.
+        The blocking SDK iterator runs in a worker thread and hands chunks to
+        the event loop through a queue. Safety blocks and empty responses
+        produce the same messages as generate.
+
+        Retries and hedging apply until the first chunk arrives (timeout is
+        the deadline for it); after that a stall longer than idle_timeout or
+        an upstream error ends the stream with an ERROR_PREFIX message.
+        """
+        effective_prompt = self._build_prompt(prompt, pdf_context)
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        stats = {"attempts": 0, "hedged": False}
+
+        def start(request_timeout):
+            queue: asyncio.Queue = asyncio.Queue()
+            cancel = threading.Event()
+            emit = lambda item: loop.call_soon_threadsafe(queue.put_nowait, item)
+            loop.run_in_executor(self._executor, self._stream_worker, effective_prompt, request_timeout, emit, cancel)
+
+            async def first_item():
+                kind, value = await queue.get()
+                if kind == "error":
+                    raise value
+                return kind, value, queue, cancel
+            return first_item(), cancel.set
+
+        try:
+            kind, value, queue, cancel = await self._with_retries(start, self.first_chunk_latency, stats)
+        except Exception as e:
+            print(f"LLM Generation Error: {e}")
+            self._record_call("stream", started, stats, "timeout" if isinstance(e, TimeoutError) else "error",
+                              len(effective_prompt))
+            yield f"{ERROR_PREFIX}: {str(e)}"
+            return
+
+        first_chunk = time.monotonic() - started
+        outcome = "ok"
+        response_chars = 0
+        try:
+            while kind != "end":
+                if kind == "error":
+                    print(f"LLM Generation Error: {value}")
+                    outcome = "error"
+                    yield f"\n\n{ERROR_PREFIX}: {value}"
+                    break
+                response_chars += len(value)
+                yield value
+                try:
+                    kind, value = await asyncio.wait_for(queue.get(), self.idle_timeout)
+                except asyncio.TimeoutError:
+                    outcome = "timeout"
+                    yield f"\n\n{ERROR_PREFIX}: the response stalled for {self.idle_timeout:g}s"
+                    break
+        finally:
+            # Also reached when the consumer stops early
+            cancel.set()
+            self._record_call("stream", started, stats, outcome, len(effective_prompt), response_chars, first_chunk)
 
     async def transcribe_bytes(self, audio_bytes: bytes) -> str:
         loop = asyncio.get_event_loop()
         def _call():
             try:
                 # Try using Gemini's audio transcription
-                resp = genai.audio.speech_to_text(content=audio_bytes)
+                resp = self._genai.audio.speech_to_text(content=audio_bytes)
                 text = getattr(resp, 'text', str(resp))
                 if text and text.strip():
                     return text
@@ -80,7 +381,4 @@ User Question: {prompt}"""
             print(f"Warning: Could not transcribe audio ({len(audio_bytes)} bytes). Using fallback.")
             return "[Audio received but transcription not available - please use text mode]"
         
-        return await loop.run_in_executor(None, _call)
-
-    async def partial_transcribe_bytes(self, audio_bytes: bytes) -> Optional[str]:
-        return None
+        return await loop.run_in_executor(self._executor, _call)
@@ -0,0 +1,273 @@
+import asyncio
+import os
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from utils.answer_cache import SemanticAnswerCache
+from utils.audio import AudioStreamer
+from utils.ingest import extract_segments, iter_csv_chunks
+from utils.lazy import ComponentRegistry
+from utils.llm import ERROR_PREFIX, NO_RESPONSE, GeminiLLM
+from utils.rag import DEFAULT_NAMESPACE, RAGEngine, content_hash
+from utils.resilience import RetryPolicy
+from utils.stt import StreamingTranscriber
+from utils.stt_service import TranscriptionResult, TranscriptionService
+from utils.tracing import tracer
+
+# Model-backed components are only built on first use (or by the background
+# warm-up), so neither the UI nor the server waits for a model to load at start
+def build_audio_streamer():
+    # Optional on-disk tier for the synthesized-audio cache
+    streamer = AudioStreamer(cache_dir=os.getenv("TTS_CACHE_DIR"))
+    streamer.preload()
+    return streamer
+
+def build_rag_engine(persist_dir):
+    # Shared by all sessions; each one searches only its own namespace.
+    # Idle namespaces are evicted after RAG_NAMESPACE_TTL seconds and the
+    # least recently used go first once RAG_MAX_CHUNKS is exceeded. Shared
+    # namespaces have no uploader to re-index them, so they are never evicted
+    pinned = {DEFAULT_NAMESPACE} | ({os.getenv("RAG_NAMESPACE")} if os.getenv("RAG_NAMESPACE") else set())
+    return RAGEngine(
+        model_name="all-MiniLM-L6-v2",
+        persist_directory=persist_dir,
+        namespace_ttl=float(os.getenv("RAG_NAMESPACE_TTL", "7200")),
+        max_chunks=int(os.getenv("RAG_MAX_CHUNKS", "200000")),
+        # 'onnx-int8' trades a little recall for CPU speed; measure both with benchmarks.bench_embeddings
+        embedding_backend=os.getenv("EMBEDDING_BACKEND", "torch"),
+        embedding_threads=int(os.getenv("EMBEDDING_THREADS", "0")),
+        embedding_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "32")),
+        pinned_namespaces=pinned
+    )
+
+def build_stt_service():
+    # Pool of Whisper workers shared by all sessions, with a bounded request queue
+    # 'fast' (greedy) or 'accurate' (beam search)
+    latency_profile = os.getenv("STT_LATENCY_PROFILE", "fast")
+    return TranscriptionService(
+        num_workers=int(os.getenv("STT_WORKERS", "2")),
+        max_queue=int(os.getenv("STT_MAX_QUEUE", "8")),
+        model_size="tiny",
+        device="cpu",
+        compute_type="int8",
+        latency_profile=latency_profile
+    )
+
+def build_llm(api_key, model):
+    # Deadline per answer (or first streamed chunk), retries for transient errors,
+    # and a duplicate request once an attempt is slower than the p95 of recent ones
+    hedge = os.getenv("LLM_HEDGE_PERCENTILE", "0.95")
+    return GeminiLLM(
+        api_key=api_key,
+        model=model,
+        timeout=float(os.getenv("LLM_TIMEOUT", "30")),
+        retry=RetryPolicy(max_attempts=int(os.getenv("LLM_MAX_ATTEMPTS", "3"))),
+        hedge_percentile=float(hedge) if hedge not in ("", "off") else None
+    )
+
+def build_pipeline(api_key: str, model: Optional[str], persist_dir: Optional[str] = None) -> "Pipeline":
+    """
+    Pipeline configured from the environment (see .env.example).
+    """
+    # Registration order is warm-up order: retrieval and speech first
+    components = ComponentRegistry({
+        "rag_engine": lambda: build_rag_engine(persist_dir),
+        "stt_service": build_stt_service,
+        "audio_streamer": build_audio_streamer,
+        "llm": lambda: build_llm(api_key, model),
+    })
+    # Shared across sessions: identical questions over identical context get identical answers
+    answer_cache = SemanticAnswerCache(threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92")))
+    return Pipeline(components, answer_cache, metrics_file=os.getenv("METRICS_FILE"))
+
+async def _single_piece(text: str) -> AsyncIterator[str]:
+    yield text
+
+class Pipeline:
+    """
+    The ingestion -> retrieval -> generation -> TTS pipeline, with no UI.
+
+    Every call names the document namespace it works on, so one instance
+    serves any number of concurrent sessions. main.py runs it in-process;
+    server.py serves it over HTTP and WebSocket, and
+    utils.engine_client.EngineClient is the remote stand-in with the same
+    methods.
+    """
+    def __init__(self, components: ComponentRegistry, answer_cache: Optional[SemanticAnswerCache] = None,
+                 metrics_file: Optional[str] = None):
+        """
+        Args:
+            components: Lazy rag_engine, stt_service, audio_streamer and llm.
+            answer_cache: Semantic cache of answers per context.
+            metrics_file: If set, the tracer snapshot is written there after every turn.
+        """
+        self.components = components
+        self.answer_cache = answer_cache or SemanticAnswerCache()
+        self.metrics_file = metrics_file
+
+    @property
+    def rag_engine(self) -> RAGEngine:
+        return self.components["rag_engine"]
+
+    def start_warm_up(self):
+        self.components.start_warm_up()
+
+    def timings(self) -> List[Dict[str, Any]]:
+        """
+        ComponentRegistry.timings() plus the Whisper models, which load in
+        the transcription worker threads.
+        """
+        rows = self.components.timings()
+        stt_service = self.components["stt_service"]
+        if stt_service.loaded and stt_service.stats()["model_load_seconds"] is not None:
+            rows.append({"component": "whisper models", "loaded": True,
+                         "load_seconds": stt_service.stats()["model_load_seconds"],
+                         "loaded_by": "worker threads", "error": None})
+        return rows
+
+    def metrics(self) -> Dict[str, Any]:
+        return tracer.snapshot()
+
+    # --- Documents ---
+
+    def evict_idle(self) -> List[str]:
+        """
+        Evicts idle namespaces, if the engine has been loaded at all.
+        """
+        if not self.rag_engine.loaded:
+            return []
+        return self.rag_engine.evict_idle()
+
+    def indexed_sources(self, namespace: str) -> Dict[str, str]:
+        return self.rag_engine.indexed_sources(namespace)
+
+    def corpus_version(self, namespace: str) -> int:
+        return self.rag_engine.corpus_version(namespace)
+
+    def clear(self, namespace: str):
+        self.rag_engine.clear_database(namespace)
+
+    def index_upload(self, name: str, data: bytes, namespace: str,
+                     progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+                     file_hash: Optional[str] = None) -> int:
+        """
+        Streams one uploaded file into a namespace. CSVs are indexed as
+        whole-row record chunks, everything else as word-window chunks.
+        Returns the number of chunks embedded.
+        """
+        file_hash = file_hash or content_hash(data)
+        if name.endswith(".csv"):
+            return self.rag_engine.index_chunks(iter_csv_chunks(data), name, file_hash, progress_callback, namespace)
+        return self.rag_engine.index_document(extract_segments(data, name), name, file_hash, progress_callback,
+                                              namespace=namespace)
+
+    # --- Speech ---
+
+    def transcribe(self, audio_bytes: bytes, latency_profile: Optional[str] = None,
+                   timeout: Optional[float] = 120) -> TranscriptionResult:
+        """
+        Transcribes a clip on the shared worker pool; raises ServiceOverloaded
+        when its queue is full.
+        """
+        return self.components["stt_service"].transcribe(audio_bytes, latency_profile, timeout=timeout)
+
+    def stream_transcriber(self, **kwargs) -> StreamingTranscriber:
+        """
+        Starts a live transcription session (16 kHz mono int16 PCM) whose
+        decodes queue on the shared worker pool; see StreamingTranscriber.
+        """
+        return self.components["stt_service"].stream(**kwargs)
+
+    # --- Answers ---
+
+    async def answer(self, question: str, namespace: str, with_audio: bool = True,
+                     is_audio: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answers one question as a stream of events:
+
+            {"type": "text", "text": ...}       answer text as it is generated
+            {"type": "audio", "data": bytes}    MP3 of each sentence, in order
+            {"type": "error", "stage": "tts", "message": ...}
+            {"type": "done", "text": ..., "cached": bool}
+
+        Text and audio events interleave: the first sentence is synthesized
+        while later ones are still being generated. The turn runs in its own
+        task, so a consumer that stops early cancels it.
+        """
+        events: asyncio.Queue = asyncio.Queue()
+        turn = asyncio.create_task(self._run_turn(question, namespace, with_audio, is_audio, events.put_nowait))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            await turn
+        finally:
+            turn.cancel()
+
+    async def _run_turn(self, question, namespace, with_audio, is_audio, emit):
+        try:
+            # One trace per turn: retrieval, Gemini and TTS spans are recorded under it
+            with tracer.span("turn", input_chars=len(question), audio_input=is_audio):
+                await self._answer_turn(question, namespace, with_audio, emit)
+            if self.metrics_file:
+                tracer.export_json(self.metrics_file)
+        finally:
+            emit(None)
+
+    async def _answer_turn(self, question, namespace, with_audio, emit):
+        # Loading a component can take seconds; keep it off the event loop
+        rag_engine = await asyncio.to_thread(self.components["rag_engine"].get)
+        llm = await asyncio.to_thread(self.components["llm"].get)
+
+        # Retrieve relevant context if documents are indexed. corpus_version may
+        # reload a spilled namespace from the store, so it stays off the loop too
+        context = None
+        if await asyncio.to_thread(rag_engine.corpus_version, namespace):
+            context = await asyncio.to_thread(rag_engine.retrieve, question, namespace=namespace)
+
+        # A similar question over the same context skips the Gemini call;
+        # its audio then comes straight from the TTS cache
+        query_embedding = await asyncio.to_thread(rag_engine.embed_query, question)
+        context_fingerprint = content_hash(context or "")
+        corpus_version = (namespace, await asyncio.to_thread(rag_engine.corpus_version, namespace))
+        cached_answer = self.answer_cache.lookup(query_embedding, context_fingerprint, corpus_version)
+        if cached_answer is not None:
+            answer_stream = _single_piece(cached_answer)
+        else:
+            answer_stream = llm.generate_stream(question, pdf_context=context)
+
+        # Sentences are handed to the pipelined TTS while the answer is still streaming
+        tts_text: asyncio.Queue = asyncio.Queue()
+        tts_task = None
+        if with_audio:
+            audio_streamer = await asyncio.to_thread(self.components["audio_streamer"].get)
+
+            async def _answer_pieces():
+                while (piece := await tts_text.get()) is not None:
+                    yield piece
+
+            async def _synthesize():
+                try:
+                    async for segment in audio_streamer.stream_audio(_answer_pieces()):
+                        emit({"type": "audio", "data": segment})
+                except Exception as e:
+                    print(f"DEBUG: TTS Error details: {e}")
+                    emit({"type": "error", "stage": "tts", "message": str(e)})
+
+            tts_task = asyncio.create_task(_synthesize())
+
+        response_text = ""
+        try:
+            async for piece in answer_stream:
+                response_text += piece
+                tts_text.put_nowait(piece)
+                emit({"type": "text", "text": piece})
+            tts_text.put_nowait(None)
+            if tts_task is not None:
+                await tts_task
+        finally:
+            if tts_task is not None:
+                tts_task.cancel()
+
+        # Failures can also end a stream part-way, so look for the error anywhere
+        if cached_answer is None and ERROR_PREFIX not in response_text and response_text != NO_RESPONSE:
+            self.answer_cache.store(query_embedding, context_fingerprint, corpus_version, response_text)
+        emit({"type": "done", "text": response_text, "cached": cached_answer is not None})
@@ -1,93 +1,725 @@
-import chromadb
-from chromadb.utils import embedding_functions
+from array import array
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import hashlib
+import itertools
 import os
-from typing import List, Optional
+import re
+import threading
+import time
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from utils.bm25 import BM25Index, reciprocal_rank_fusion
+from utils.cache import LRUCache, TieredByteCache
+from utils.context import CHUNK_TOKENS, assemble_context
+from utils.tracing import tracer
+
+DEFAULT_NAMESPACE = "default"
+# About one word pair in this many ends a chunk (see iter_chunks)
+CHUNK_BOUNDARY_DIVISOR = 64
+# Per-session namespaces are named after the session id (uuid4().hex, see main.py)
+_SESSION_NAMESPACE = re.compile(r"^[0-9a-f]{32}$")
+
+def iter_chunks(segments: Iterable[str], chunk_size: int = 400, overlap: int = 50) -> Iterator[str]:
+    """
+    Yields chunks of at most chunk_size words from a stream of text segments.
+
+    A chunk ends after a word pair whose hash hits the boundary pattern
+    (once it has chunk_size / 2 words) or at chunk_size words, and the
+    next one starts with its last overlap words. Boundaries depend on the
+    words around them rather than on their position, so inserting or
+    deleting text only changes the chunks near the edit; the chunks after
+    it keep their content hash and their stored embedding is reused.
+    """
+    min_words = chunk_size // 2
+    words: List[str] = []
+    carried = 0
+    prev = ""
+    for segment in segments:
+        for word in segment.split():
+            words.append(word)
+            boundary = zlib.crc32(f"{prev} {word}".encode("utf-8")) % CHUNK_BOUNDARY_DIVISOR == 0
+            prev = word
+            if len(words) >= chunk_size or (boundary and len(words) >= min_words):
+                yield " ".join(words)
+                words = words[len(words) - overlap:] if overlap else []
+                carried = len(words)
+    if len(words) > carried:
+        yield " ".join(words)
+
+def content_hash(data) -> str:
+    """
+    Returns a stable SHA-256 hex digest for text or raw bytes.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a query for cache keys: lowercased, single-spaced,
+    without surrounding punctuation.
+    """
+    return re.sub(r"\s+", " ", query.lower()).strip(" ?!.,")
+
+def is_session_namespace(namespace: str) -> bool:
+    """
+    True for a namespace named after a session id. Nothing can reach such a
+    namespace once its session has ended or the process restarted.
+    """
+    return bool(_SESSION_NAMESPACE.match(namespace))
+
+def _as_list(embedding) -> List[float]:
+    # Chroma may hand back numpy arrays or plain lists depending on version
+    return embedding.tolist() if hasattr(embedding, "tolist") else list(embedding)
+
+def _pack_embedding(embedding: List[float]) -> bytes:
+    return array("f", embedding).tobytes()
+
+def _unpack_embedding(data: bytes) -> List[float]:
+    values = array("f")
+    values.frombytes(data)
+    return values.tolist()
+
+def _iter_batches(chunks: Iterable, size: int) -> Iterator[Tuple[int, List]]:
+    """
+    Groups a chunk stream into (start_index, batch) pairs without reading ahead.
+    """
+    it = iter(chunks)
+    start = 0
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield start, batch
+        start += len(batch)
+
+def _complete_doc_hash(metadatas: List[Dict]) -> Optional[str]:
+    """
+    doc_hash of a stored document if it was written completely: every chunk
+    carries the same hash and the completion marker (doc_chunks and
+    complete_hash, set after the last batch) matches the number of chunks
+    and that hash. Chroma merges metadata on upsert, so a marker left over
+    from an earlier version carries that version's hash and doesn't count.
+    None otherwise.
+    """
+    hashes = {m.get("doc_hash") for m in metadatas}
+    if len(hashes) != 1:
+        return None
+    doc_hash = hashes.pop()
+    if not any(m.get("doc_chunks") == len(metadatas) and m.get("complete_hash") == doc_hash for m in metadatas):
+        return None
+    return doc_hash
+
+class _timed:
+    """
+    Iterator wrapper that adds up the time spent waiting on next().
+    """
+    def __init__(self, iterable: Iterable):
+        self._it = iter(iterable)
+        self.seconds = 0.0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            return next(self._it)
+        finally:
+            self.seconds += time.perf_counter() - started
 
 class RAGEngine:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        self.chroma_client = chromadb.Client() # Ephemeral client
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", persist_directory: Optional[str] = None,
+                 batch_size: int = 64, embed_workers: int = 2, query_cache_size: int = 256,
+                 context_token_budget: Optional[int] = None, namespace_ttl: Optional[float] = None,
+                 max_chunks: Optional[int] = None, embedding_backend: str = "torch",
+                 embedding_threads: int = 0, embedding_batch_size: int = 32,
+                 pinned_namespaces: Iterable[str] = (), embedding_cache_bytes: int = 32 * 1024 * 1024,
+                 embedding_cache_disk_bytes: int = 256 * 1024 * 1024):
+        """
+        Args:
+            model_name: Sentence Transformers model used for embeddings.
+            persist_directory: If set, the index is stored on disk there and
+                survives restarts. Otherwise an ephemeral in-memory client is used.
+            batch_size: Number of chunks embedded and written per batch.
+            embed_workers: Threads embedding batches in parallel while writes run.
+            query_cache_size: Entries kept in the query embedding and result LRU caches.
+            context_token_budget: Default token budget for the context built by retrieve
+                (None fits n_results chunks; see utils.context.CHUNK_TOKENS).
+            namespace_ttl: Seconds a namespace may go unused before evict_idle evicts it
+                (None keeps namespaces until they are cleared).
+            max_chunks: Cap on chunks held across all namespaces; beyond it the least
+                recently used namespaces are evicted after each indexing run.
+            embedding_backend: "torch" (float reference), "onnx" or "onnx-int8";
+                see utils.embeddings. Each backend gets its own collection, as
+                vectors from different backends must not be mixed.
+            embedding_threads: CPU threads for the embedding model (0 = library default).
+            embedding_batch_size: Texts per forward pass of the embedding model.
+            pinned_namespaces: Namespaces never evicted, e.g. shared ones that have
+                no uploader to re-index them.
+            embedding_cache_bytes: Memory cap of the cache of chunk embeddings by
+                content hash, which outlives the chunks themselves.
+            embedding_cache_disk_bytes: Cap of the cache's on-disk tier, kept
+                under persist_directory (unused in memory).
+
+        Every document lives in a namespace (e.g. one per session or tenant).
+        Chunks share one collection and are partitioned by a "namespace"
+        metadata field, so searches only scan the caller's chunks while
+        embeddings are still reused across namespaces.
+
+        Evicting a namespace deletes its chunks, except with persist_directory
+        for namespaces not named after a session (see is_session_namespace):
+        those stay on disk and only their in-memory keyword index is spilled;
+        it is reloaded from the stored chunks the next time the namespace is
+        used. On startup only pinned namespaces are loaded, other shared ones
+        start spilled and session namespaces left by earlier runs are deleted.
+
+        Deleting chunks doesn't lose their embeddings: those stay in the
+        embedding cache, so re-uploading the same file into a new session
+        or after a restart embeds nothing.
+        """
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.context_token_budget = context_token_budget
+        self.namespace_ttl = namespace_ttl
+        self.max_chunks = max_chunks
+        self.persistent = bool(persist_directory)
+        self.pinned_namespaces = set(pinned_namespaces)
+        self._write_lock = threading.Lock()
+
+        # Per-namespace keyword index, corpus version and last access time.
+        # Versions come from one counter so a dropped and recreated namespace
+        # never reuses a result cache key.
+        self._namespace_lock = threading.Lock()
+        self._bm25: Dict[str, BM25Index] = {}
+        self._versions: Dict[str, int] = {}
+        self._last_used: Dict[str, float] = {}
+        self._spilled: set = set()
+        self._version_counter = itertools.count(1)
+        self._query_embedding_cache = LRUCache(maxsize=query_cache_size)
+        self._result_cache = LRUCache(maxsize=query_cache_size)
+        # Imported on construction so that importing this module stays cheap
+        import chromadb
+        from utils.embeddings import create_embedding_function
+
+        if persist_directory:
+            os.makedirs(persist_directory, exist_ok=True)
+            self.chroma_client = chromadb.PersistentClient(path=persist_directory)
+        else:
+            self.chroma_client = chromadb.Client() # Ephemeral client
         
-        # Use Sentence Transformers for local embeddings
-        # This will download the model on first use
-        self.embedding_fn = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=model_name
+        # Local embeddings; the model is downloaded on first use
+        self.embedding_backend = embedding_backend
+        self.embedding_fn = create_embedding_function(
+            embedding_backend, model_name, threads=embedding_threads, batch_size=embedding_batch_size
         )
         
+        self.collection_name = "pdf_context" if embedding_backend == "torch" else f"pdf_context__{embedding_backend}"
+        # Keyed by chunk content hash only, per backend like the collection
+        self._embedding_cache = TieredByteCache(
+            max_memory_bytes=embedding_cache_bytes,
+            directory=os.path.join(persist_directory, "embeddings", self.collection_name) if persist_directory else None,
+            max_disk_bytes=embedding_cache_disk_bytes,
+            maxsize=max(1, embedding_cache_bytes // 1024)
+        )
         self.collection = self.chroma_client.create_collection(
-            name="pdf_context",
+            name=self.collection_name,
             embedding_function=self.embedding_fn,
             get_or_create=True
         )
 
+        # Keyword indexes kept alongside the collection for hybrid retrieval
+        self._load_keyword_index()
+
+    def _load_keyword_index(self, page_size: int = 1000):
+        """
+        Prepares the per-namespace BM25 indexes for chunks already in the
+        collection (persistent mode). Pinned namespaces are loaded from the
+        stored text (nothing is re-embedded); other shared namespaces start
+        spilled and load on first use, so startup stays within max_chunks.
+        Session namespaces left by an earlier run are unreachable and are
+        deleted. Chunks stored before namespaces existed are tagged with the
+        default namespace.
+        """
+        namespaces = set()
+        offset = 0
+        while True:
+            page = self.collection.get(include=["metadatas"], limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            untagged = [(doc_id, meta) for doc_id, meta in zip(page["ids"], page["metadatas"]) if "namespace" not in meta]
+            if untagged:
+                self.collection.update(
+                    ids=[doc_id for doc_id, _ in untagged],
+                    metadatas=[{**meta, "namespace": DEFAULT_NAMESPACE} for _, meta in untagged]
+                )
+            namespaces.update(meta.get("namespace", DEFAULT_NAMESPACE) for meta in page["metadatas"])
+            offset += len(page["ids"])
+
+        orphaned = [ns for ns in namespaces if is_session_namespace(ns) and ns not in self.pinned_namespaces]
+        for namespace in orphaned:
+            self.drop_namespace(namespace)
+        if orphaned:
+            print(f"Deleted {len(orphaned)} namespace(s) left by ended sessions")
+        with self._namespace_lock:
+            self._spilled.update(namespaces - set(orphaned))
+        for namespace in namespaces & self.pinned_namespaces:
+            self._restore(namespace, page_size)
+
+    def _touch(self, namespace: str) -> BM25Index:
+        """
+        Marks a namespace as used now and returns its keyword index.
+        """
+        if namespace in self._spilled:
+            self._restore(namespace)
+        with self._namespace_lock:
+            self._last_used[namespace] = time.monotonic()
+            index = self._bm25.get(namespace)
+            if index is None:
+                index = self._bm25[namespace] = BM25Index()
+                self._versions[namespace] = next(self._version_counter)
+            return index
+
+    def _restore(self, namespace: str, page_size: int = 1000):
+        """
+        Reloads a spilled namespace's keyword index from its stored chunks.
+        """
+        index = BM25Index()
+        offset = 0
+        while True:
+            page = self.collection.get(where={"namespace": namespace}, include=["documents"],
+                                       limit=page_size, offset=offset)
+            if not page["ids"]:
+                break
+            for doc_id, doc in zip(page["ids"], page["documents"]):
+                index.add(doc_id, doc)
+            offset += len(page["ids"])
+        with self._namespace_lock:
+            # Another thread may have restored it meanwhile
+            if namespace in self._spilled:
+                self._spilled.discard(namespace)
+                self._bm25[namespace] = index
+                self._versions[namespace] = next(self._version_counter)
+                self._last_used[namespace] = time.monotonic()
+        print(f"Restored spilled namespace {namespace} ({len(index)} chunks)")
+
+    def _bump_version(self, namespace: str):
+        with self._namespace_lock:
+            self._versions[namespace] = next(self._version_counter)
+
+    def corpus_version(self, namespace: str = DEFAULT_NAMESPACE) -> int:
+        """
+        Returns a number that changes whenever the namespace's documents change.
+        """
+        if namespace in self._spilled:
+            self._restore(namespace)
+        return self._versions.get(namespace, 0)
+
     def split_text(self, text: str, chunk_size: int = 400, overlap: int = 50) -> List[str]:
         """
-        Splits text into chunks based on word count.
+        Splits text into chunks of at most chunk_size words at content-defined
+        boundaries; see iter_chunks.
         """
-        words = text.split()
-        chunks = []
-        start = 0
-        while start < len(words):
-            end = start + chunk_size
-            chunk_words = words[start:end]
-            chunks.append(" ".join(chunk_words))
-            start += chunk_size - overlap
-        return chunks
+        return list(self.iter_chunks([text], chunk_size, overlap))
 
-    def index_document(self, text: str, filename: str):
+    def iter_chunks(self, segments: Iterable[str], chunk_size: int = 400, overlap: int = 50) -> Iterator[str]:
         """
-        Splits text into chunks and indexes them in ChromaDB.
+        Streaming form of split_text: consumes text segments (pages, lines,
+        paragraphs) and yields chunks as they fill up, so the whole document
+        is never held as one string. See the module-level iter_chunks.
         """
-        # NOTE: We no longer clear the collection here to allow multiple documents.
-        
-        chunks = self.split_text(text)
-        if not chunks:
-            return
+        return iter_chunks(segments, chunk_size, overlap)
 
+    def _lookup_embeddings(self, hashes: List[str]) -> Dict[str, list]:
+        """
+        Returns known embeddings for the given chunk content hashes, from the
+        namespace-independent embedding cache or else from stored chunks.
+        """
+        known = {}
+        for h in set(hashes):
+            data = self._embedding_cache.get(h)
+            if data is not None:
+                known[h] = _unpack_embedding(data)
+        unique = [h for h in set(hashes) if h not in known]
+        if not unique:
+            return known
+        found = self.collection.get(
+            where={"content_hash": {"$in": unique}},
+            include=["embeddings", "metadatas"]
+        )
+        for meta, embedding in zip(found["metadatas"], found["embeddings"]):
+            if meta["content_hash"] not in known:
+                known[meta["content_hash"]] = _as_list(embedding)
+                self._embedding_cache.put(meta["content_hash"], _pack_embedding(known[meta["content_hash"]]))
+        return known
+
+    def _embed_batch(self, chunks: List[str]) -> Tuple[List[str], List[list], int]:
+        """
+        Embeds one batch of chunks, reusing known embeddings for known content.
+        Returns the content hashes, the embeddings and how many were computed.
+        """
+        hashes = [content_hash(chunk) for chunk in chunks]
+        known = self._lookup_embeddings(hashes)
+
+        # Only embed chunks whose content has never been seen before
+        missing = [i for i, h in enumerate(hashes) if h not in known]
+        if missing:
+            with tracer.span("rag.embed", texts=len(missing), chars=sum(len(chunks[i]) for i in missing)):
+                new_embeddings = self.embedding_fn([chunks[i] for i in missing])
+            for i, embedding in zip(missing, new_embeddings):
+                known[hashes[i]] = _as_list(embedding)
+                self._embedding_cache.put(hashes[i], _pack_embedding(known[hashes[i]]))
+        return hashes, [known[h] for h in hashes], len(missing)
+
+    def _write_batch(self, namespace: str, filename: str, doc_hash: str, start: int, chunks: List[str],
+                     hashes: List[str], embeddings: List[list],
+                     extra_metadata: Optional[List[Optional[Dict]]] = None) -> List[str]:
+        """
+        Upserts one embedded batch and returns the IDs written.
+        """
         # Create unique IDs for chunks
-        ids = [f"{filename}_{i}" for i in range(len(chunks))]
-        metadatas = [{"source": filename, "chunk_id": i} for i in range(len(chunks))]
+        ids = [f"{namespace}/{filename}_{start + i}" for i in range(len(chunks))]
+        metadatas = [
+            {**((extra_metadata and extra_metadata[i]) or {}),
+             "namespace": namespace, "source": filename, "chunk_id": start + i,
+             "content_hash": hashes[i], "doc_hash": doc_hash}
+            for i in range(len(chunks))
+        ]
+        with tracer.span("rag.write", chunks=len(chunks)), self._write_lock:
+            self.collection.upsert(
+                documents=chunks,
+                embeddings=embeddings,
+                ids=ids,
+                metadatas=metadatas
+            )
+        keyword_index = self._touch(namespace)
+        for doc_id, chunk in zip(ids, chunks):
+            keyword_index.add(doc_id, chunk)
+        return ids
+
+    def index_document(self, text: Union[str, Iterable[str]], filename: str, doc_hash: Optional[str] = None,
+                       progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+                       namespace: str = DEFAULT_NAMESPACE) -> int:
+        """
+        Splits text into chunks and indexes them in ChromaDB under namespace.
+
+        text may be a string or an iterable of text segments (see utils.ingest);
+        segments are chunked as they arrive and a doc_hash must be supplied.
+        Chunks are keyed by content hash: a chunk whose text is already stored
+        (in this or any other document) reuses its embedding, and re-indexing an
+        unchanged document is a no-op. Batches are embedded on a worker pool
+        while finished batches are written, and progress_callback(done, total)
+        is called after each write (total is None for streams). Afterwards the
+        max_chunks cap is enforced. Returns the number of chunks embedded.
+        """
+        if isinstance(text, str):
+            chunks = self.split_text(text)
+            if not chunks:
+                return 0
+            doc_hash = doc_hash or content_hash(text)
+            total = len(chunks)
+        elif doc_hash is None:
+            raise ValueError("doc_hash is required when indexing a stream of text segments")
+        else:
+            chunks = self.iter_chunks(text)
+            total = None
+        return self.index_chunks(((chunk, None) for chunk in chunks), filename, doc_hash,
+                                 progress_callback, namespace, total)
+
+    def index_chunks(self, chunks: Iterable[Tuple[str, Optional[Dict]]], filename: str, doc_hash: str,
+                     progress_callback: Optional[Callable[[int, Optional[int]], None]] = None,
+                     namespace: str = DEFAULT_NAMESPACE, total: Optional[int] = None) -> int:
+        """
+        Indexes ready-made chunks, given as (text, metadata) pairs, through the
+        same batched pipeline as index_document. Use it for sources that chunk
+        themselves, such as CSV records (utils.ingest.iter_csv_chunks); the
+        metadata (e.g. row ranges) is stored with each chunk. The stream is
+        consumed batch by batch, so memory does not grow with the source.
+        """
+        with tracer.span("rag.index_document", source=filename, namespace=namespace) as span:
+            return self._index_chunks(chunks, filename, doc_hash, progress_callback, namespace, total, span)
+
+    def _index_chunks(self, chunks, filename, doc_hash, progress_callback, namespace, total, span) -> int:
+        # NOTE: We no longer clear the collection here to allow multiple documents.
         
-        self.collection.add(
-            documents=chunks,
-            ids=ids,
-            metadatas=metadatas
+        existing = self.collection.get(
+            where={"$and": [{"namespace": namespace}, {"source": filename}]},
+            include=["metadatas"]
         )
-        print(f"Indexed {len(chunks)} chunks for {filename}")
+        if existing["ids"] and _complete_doc_hash(existing["metadatas"]) == doc_hash:
+            print(f"Skipped {filename}: already indexed")
+            span.set(skipped=True)
+            return 0
+
+        batches = _timed(_iter_batches(chunks, self.batch_size))
+        written = set()
+        try:
+            embedded, done = self._write_batches(batches, namespace, filename, doc_hash, progress_callback, total,
+                                                 written)
+        except BaseException:
+            # Don't leave a mix of old and new chunks behind: drop the whole document
+            self._delete_ids(namespace, set(existing["ids"]) | written)
+            self._bump_version(namespace)
+            raise
+
+        # Drop trailing chunks left over from a longer previous version
+        self._delete_ids(namespace, [i for i in existing["ids"] if i not in written])
+        if done:
+            # Completion marker on the first chunk; a document without it is re-indexed next time
+            first_id = f"{namespace}/{filename}_0"
+            first = self.collection.get(ids=[first_id], include=["metadatas"])
+            with self._write_lock:
+                marker = {"doc_chunks": done, "complete_hash": doc_hash}
+                self.collection.update(ids=[first_id], metadatas=[{**first["metadatas"][0], **marker}])
+
+        self._bump_version(namespace)
+
+        print(f"Indexed {done} chunks for {filename} ({embedded} embedded, {done - embedded} reused)")
+        # Time spent producing chunks: file extraction plus chunking, interleaved with embedding
+        tracer.record("ingest.extract_chunk", batches.seconds, source=filename, chunks=done)
+        span.set(chunks=done, embedded=embedded, reused=done - embedded)
+        self._enforce_chunk_cap(keep=namespace)
+        return embedded
+
+    def _delete_ids(self, namespace: str, ids: Iterable[str]):
+        ids = list(ids)
+        if not ids:
+            return
+        with self._write_lock:
+            self.collection.delete(ids=ids)
+        keyword_index = self._touch(namespace)
+        for doc_id in ids:
+            keyword_index.remove(doc_id)
+
+    def _write_batches(self, batches, namespace, filename, doc_hash, progress_callback, total,
+                       written: set) -> Tuple[int, int]:
+        """
+        Embeds and writes the batch stream, adding the IDs written to written.
+        Returns (chunks embedded, chunks written).
+        """
+        embedded = 0
+        done = 0
+        # Keep at most embed_workers + 1 batches in flight so memory stays bounded
+        with ThreadPoolExecutor(max_workers=self.embed_workers) as pool:
+            pending = deque()
+            def _submit(start, batch):
+                texts = [text for text, _ in batch]
+                # Run in a copy of this context so embed spans join the indexing trace
+                future = pool.submit(contextvars.copy_context().run, self._embed_batch, texts)
+                pending.append((start, texts, [meta for _, meta in batch], future))
+
+            for start, batch in itertools.islice(batches, self.embed_workers + 1):
+                _submit(start, batch)
+
+            while pending:
+                start, batch, extra_metadata, future = pending.popleft()
+                hashes, embeddings, n_embedded = future.result()
+
+                # Queue the next batch before writing so embedding overlaps the write
+                nxt = next(batches, None)
+                if nxt:
+                    _submit(*nxt)
+
+                written.update(self._write_batch(namespace, filename, doc_hash, start, batch, hashes, embeddings,
+                                                 extra_metadata))
+                embedded += n_embedded
+                done += len(batch)
+                if progress_callback:
+                    progress_callback(done, total)
+        return embedded, done
+
+    def indexed_sources(self, namespace: str = DEFAULT_NAMESPACE) -> Dict[str, str]:
+        """
+        Returns a mapping of the namespace's indexed source names to their document
+        hash ("" for a document that was not written completely, so it gets re-indexed).
+        """
+        stored = self.collection.get(where={"namespace": namespace}, include=["metadatas"])
+        by_source: Dict[str, List[Dict]] = {}
+        for metadata in stored["metadatas"]:
+            by_source.setdefault(metadata["source"], []).append(metadata)
+        return {source: _complete_doc_hash(metadatas) or "" for source, metadatas in by_source.items()}
 
-    def clear_database(self):
+    def clear_database(self, namespace: Optional[str] = None):
         """
-        Clears the entire database.
+        Clears one namespace, or the entire database when namespace is None.
         """
+        if namespace is not None:
+            self.drop_namespace(namespace)
+            return
+
         try:
-            self.chroma_client.delete_collection("pdf_context")
+            self.chroma_client.delete_collection(self.collection_name)
         except:
             pass
         
         self.collection = self.chroma_client.create_collection(
-            name="pdf_context",
+            name=self.collection_name,
             embedding_function=self.embedding_fn,
             get_or_create=True
         )
+        with self._namespace_lock:
+            self._bm25.clear()
+            self._versions.clear()
+            self._last_used.clear()
+            self._spilled.clear()
 
-    def retrieve(self, query: str, n_results: int = 5) -> str:
+    def drop_namespace(self, namespace: str):
         """
-        Retrieves relevant context for a query.
+        Deletes every chunk in a namespace and forgets its keyword index.
         """
-        if self.collection.count() == 0:
-            return ""
+        with self._write_lock:
+            self.collection.delete(where={"namespace": namespace})
+        with self._namespace_lock:
+            self._bm25.pop(namespace, None)
+            self._versions.pop(namespace, None)
+            self._last_used.pop(namespace, None)
+            self._spilled.discard(namespace)
 
-        results = self.collection.query(
-            query_texts=[query],
-            n_results=min(n_results, self.collection.count())
-        )
-        
-        # Combine retrieved documents
-        if results['documents'] and results['documents'][0]:
-            # Add source info to context
-            context_parts = []
-            for i, doc in enumerate(results['documents'][0]):
-                source = results['metadatas'][0][i].get('source', 'Unknown')
-                context_parts.append(f"[Source: {source}]\n{doc}")
-            
-            return "\n\n".join(context_parts)
-        return ""
+    def _evict(self, namespace: str):
+        """
+        Frees a namespace's memory: spills a shared namespace when persistent
+        (chunks stay on disk), drops it otherwise.
+        """
+        if not self.persistent or (is_session_namespace(namespace) and namespace not in self.pinned_namespaces):
+            self.drop_namespace(namespace)
+            return
+        with self._namespace_lock:
+            if self._bm25.pop(namespace, None) is not None:
+                self._spilled.add(namespace)
+            self._versions.pop(namespace, None)
+            self._last_used.pop(namespace, None)
+
+    def evict_idle(self, ttl_seconds: Optional[float] = None) -> List[str]:
+        """
+        Evicts namespaces unused for ttl_seconds (defaults to namespace_ttl),
+        except pinned ones, and returns their names.
+        """
+        ttl = ttl_seconds if ttl_seconds is not None else self.namespace_ttl
+        if ttl is None:
+            return []
+        cutoff = time.monotonic() - ttl
+        with self._namespace_lock:
+            idle = [ns for ns, last_used in self._last_used.items()
+                    if last_used < cutoff and ns not in self.pinned_namespaces]
+        for namespace in idle:
+            self._evict(namespace)
+        if idle:
+            print(f"Evicted {len(idle)} idle namespace(s)")
+        return idle
+
+    def _enforce_chunk_cap(self, keep: str):
+        """
+        Evicts least recently used namespaces, never keep or pinned ones,
+        until the chunk count held in memory fits max_chunks.
+        """
+        if self.max_chunks is None:
+            return
+        with self._namespace_lock:
+            sizes = {ns: len(index) for ns, index in self._bm25.items()}
+            by_age = sorted((ns for ns in sizes if ns != keep and ns not in self.pinned_namespaces),
+                            key=self._last_used.get)
+        total = sum(sizes.values())
+        for namespace in by_age:
+            if total <= self.max_chunks:
+                break
+            self._evict(namespace)
+            total -= sizes[namespace]
+            print(f"Evicted namespace {namespace} to stay under {self.max_chunks} chunks")
+
+    def namespace_stats(self) -> Dict[str, Dict]:
+        """
+        Returns chunk count and idle seconds per namespace.
+        """
+        now = time.monotonic()
+        with self._namespace_lock:
+            return {
+                ns: {"chunks": len(index), "idle_seconds": now - self._last_used[ns]}
+                for ns, index in self._bm25.items()
+            }
+
+    def embed_query(self, query: str) -> List[float]:
+        """
+        Returns the embedding of a query, served from the LRU cache when the
+        normalized query text has been embedded before.
+        """
+        key = normalize_query(query)
+        embedding = self._query_embedding_cache.get(key)
+        if embedding is None:
+            with tracer.span("rag.embed_query", query_chars=len(key)):
+                embedding = _as_list(self.embedding_fn([key])[0])
+            self._query_embedding_cache.put(key, embedding)
+        return embedding
+
+    def cache_stats(self) -> Dict[str, Dict]:
+        """
+        Returns hit/miss counters for the query embedding, result and chunk
+        embedding caches.
+        """
+        return {
+            "query_embeddings": self._query_embedding_cache.stats(),
+            "results": self._result_cache.stats(),
+            "chunk_embeddings": self._embedding_cache.stats(),
+        }
+
+    def _hybrid_search(self, query: str, n_results: int, namespace: str) -> List[Dict]:
+        """
+        Runs dense and BM25 search within a namespace over a candidate pool of
+        2 * n_results each, fuses both rankings with reciprocal-rank fusion and
+        returns the top n_results hits as {"id", "document", "metadata"} dicts,
+        best first.
+        """
+        keyword_index = self._touch(namespace)
+        count = len(keyword_index)
+        if count == 0:
+            return []
+        n_candidates = min(n_results * 2, count)
+
+        query_embedding = self.embed_query(query)
+        with tracer.span("rag.search", candidates=n_candidates):
+            dense = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_candidates,
+                where={"namespace": namespace}
+            )
+            keyword_ids = [doc_id for doc_id, _ in keyword_index.search(query, n_candidates)]
+        hits = {
+            doc_id: {"id": doc_id, "document": doc, "metadata": meta}
+            for doc_id, doc, meta in zip(dense["ids"][0], dense["documents"][0], dense["metadatas"][0])
+        }
+
+        fused = reciprocal_rank_fusion([dense["ids"][0], keyword_ids])[:n_results]
+
+        # Keyword-only hits were not returned by the vector query; fetch their text
+        missing = [doc_id for doc_id in fused if doc_id not in hits]
+        if missing:
+            extra = self.collection.get(ids=missing, include=["documents", "metadatas"])
+            for doc_id, doc, meta in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+                hits[doc_id] = {"id": doc_id, "document": doc, "metadata": meta}
+        return [hits[doc_id] for doc_id in fused if doc_id in hits]
+
+    def retrieve(self, query: str, n_results: int = 5, token_budget: Optional[int] = None,
+                 namespace: str = DEFAULT_NAMESPACE) -> str:
+        """
+        Retrieves relevant context for a query from one namespace using hybrid
+        dense + BM25 search.
+        Overlapping chunks are merged and the result is packed into token_budget
+        (defaults to context_token_budget); see utils.context.assemble_context.
+        Results are cached per normalized query and namespace version, so a
+        repeated question skips both the embedding model and the vector search.
+        """
+        with tracer.span("rag.retrieve", query_chars=len(query), namespace=namespace) as span:
+            token_budget = token_budget or self.context_token_budget or n_results * CHUNK_TOKENS
+            cache_key = (namespace, normalize_query(query), n_results, token_budget, self.corpus_version(namespace))
+            cached = self._result_cache.get(cache_key)
+            if cached is not None:
+                self._touch(namespace)
+                span.set(cached=True, context_chars=len(cached))
+                return cached
+
+            hits = self._hybrid_search(query, n_results, namespace)
+            context = assemble_context(hits, token_budget) if hits else ""
+            self._result_cache.put(cache_key, context)
+            span.set(cached=False, hits=len(hits), context_chars=len(context))
+            return context
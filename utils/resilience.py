@@ -0,0 +1,134 @@
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency for a while.
+
+    closed:    calls are allowed; failure_threshold consecutive failures open it.
+    open:      calls are refused until reset_timeout seconds have passed.
+    half_open: a single probe call is allowed; success closes the breaker,
+               failure opens it again for another reset_timeout. A probe
+               that never reports back (e.g. it was cancelled) is given up
+               after reset_timeout and another probe is let through.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def allow(self) -> bool:
+        """
+        Returns True if the protected call should be attempted now.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state != self.CLOSED and self._clock() - self._opened_at >= self.reset_timeout:
+                # Let exactly one probe through; concurrent callers keep using the fallback
+                self._state = self.HALF_OPEN
+                self._opened_at = self._clock()
+                return True
+            return False
+
+    def release(self):
+        """
+        Ends a call that finished without an outcome, such as a cancelled one.
+        A half-open probe slot is freed so the next caller probes again;
+        nothing counts as a success or failure.
+        """
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._state = self.OPEN
+                self._opened_at = self._clock() - self.reset_timeout
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+class DeadlineExceeded(TimeoutError):
+    """
+    Raised when a call does not finish before its deadline.
+    """
+
+# HTTP-style status codes and exception class names (google.api_core and
+# friends) that mark a failure as transient and worth retrying
+RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_NAMES = {"DeadlineExceeded", "ServiceUnavailable", "TooManyRequests", "ResourceExhausted",
+                   "InternalServerError", "GatewayTimeout", "BadGateway", "Aborted"}
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    True for timeouts, connection errors and transient server-side errors.
+    """
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    if type(error).__name__ in RETRYABLE_NAMES:
+        return True
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)  # grpc status enums wrap the number
+    return isinstance(code, int) and code in RETRYABLE_CODES
+
+class RetryPolicy:
+    """
+    Bounded retries with capped exponential backoff and full jitter: the
+    wait before retry n is uniform in [0, min(max_delay, base_delay * 2**n)],
+    which keeps clients that failed together from retrying together.
+    """
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 retryable: Callable[[BaseException], bool] = is_retryable, rng: Optional[random.Random] = None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retryable = retryable
+        self._rng = rng or random.Random()
+
+    def delay(self, retry: int) -> float:
+        return self._rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** retry)))
+
+class LatencyTracker:
+    """
+    Sliding window of recent latencies for percentile estimates.
+    """
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        Returns the q-quantile (0..1) of the window, or None until min_samples are in.
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
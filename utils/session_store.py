@@ -0,0 +1,150 @@
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_-]+$")
+
+class SessionStore:
+    """
+    Spill-to-disk storage for per-session chat data.
+
+    Reply audio is written to disk and referenced by ID, with a byte quota per
+    session that evicts the oldest clips first. Old transcript messages can be
+    archived to an append-only JSONL file and paged back in on demand, so the
+    in-memory session state stays small however long a conversation runs.
+    """
+    def __init__(self, root: Optional[str] = None, session_quota_bytes: int = 20 * 1024 * 1024):
+        self.root = root or os.path.join(tempfile.gettempdir(), "genova_sessions")
+        os.makedirs(self.root, exist_ok=True)
+        self.session_quota_bytes = session_quota_bytes
+        self._lock = threading.Lock()
+        # session_id -> OrderedDict(audio_id -> size), oldest first
+        self._audio: Dict[str, OrderedDict] = {}
+        self._archived: Dict[str, int] = {}
+
+    def _session_dir(self, session_id: str) -> str:
+        if not _SAFE_ID.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        path = os.path.join(self.root, session_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _audio_index(self, session_id: str) -> OrderedDict:
+        index = self._audio.get(session_id)
+        if index is None:
+            # Rebuild from disk, e.g. after a server restart
+            directory = self._session_dir(session_id)
+            files = []
+            for name in os.listdir(directory):
+                if name.endswith(".mp3"):
+                    stat = os.stat(os.path.join(directory, name))
+                    files.append((stat.st_mtime, name[:-4], stat.st_size))
+            index = OrderedDict((audio_id, size) for _, audio_id, size in sorted(files))
+            self._audio[session_id] = index
+        return index
+
+    def put_audio(self, session_id: str, data: bytes) -> str:
+        """
+        Stores a clip and returns its reference, evicting the session's oldest
+        clips if the quota is exceeded.
+        """
+        audio_id = uuid.uuid4().hex
+        directory = self._session_dir(session_id)
+        with open(os.path.join(directory, f"{audio_id}.mp3"), "wb") as f:
+            f.write(data)
+        with self._lock:
+            index = self._audio_index(session_id)
+            index[audio_id] = len(data)
+            total = sum(index.values())
+            while total > self.session_quota_bytes and len(index) > 1:
+                old_id, size = index.popitem(last=False)
+                total -= size
+                try:
+                    os.remove(os.path.join(directory, f"{old_id}.mp3"))
+                except OSError:
+                    pass
+        return audio_id
+
+    def get_audio(self, session_id: str, audio_id: str) -> Optional[bytes]:
+        """
+        Returns a stored clip, or None if it was evicted.
+        """
+        if not _SAFE_ID.match(audio_id):
+            return None
+        try:
+            with open(os.path.join(self._session_dir(session_id), f"{audio_id}.mp3"), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def session_bytes(self, session_id: str) -> int:
+        with self._lock:
+            return sum(self._audio_index(session_id).values())
+
+    def _history_path(self, session_id: str) -> str:
+        return os.path.join(self._session_dir(session_id), "history.jsonl")
+
+    def archive_messages(self, session_id: str, messages: List[Dict]):
+        """
+        Appends messages to the session's on-disk transcript.
+        """
+        with self._lock:
+            count = self.archived_count(session_id)
+            with open(self._history_path(session_id), "a", encoding="utf-8") as f:
+                for message in messages:
+                    f.write(json.dumps(message) + "\n")
+            self._archived[session_id] = count + len(messages)
+
+    def archived_count(self, session_id: str) -> int:
+        count = self._archived.get(session_id)
+        if count is None:
+            try:
+                with open(self._history_path(session_id), encoding="utf-8") as f:
+                    count = sum(1 for _ in f)
+            except OSError:
+                count = 0
+            self._archived[session_id] = count
+        return count
+
+    def load_archived(self, session_id: str, start: int, end: int) -> List[Dict]:
+        """
+        Returns archived messages [start, end) in order.
+        """
+        messages = []
+        try:
+            with open(self._history_path(session_id), encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    if i >= end:
+                        break
+                    if i >= start:
+                        messages.append(json.loads(line))
+        except OSError:
+            pass
+        return messages
+
+    def drop_session(self, session_id: str):
+        with self._lock:
+            self._audio.pop(session_id, None)
+            self._archived.pop(session_id, None)
+            shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+
+    def evict_idle(self, ttl_seconds: float = 24 * 3600):
+        """
+        Deletes sessions with no new audio or archived messages for ttl_seconds.
+        """
+        cutoff = time.time() - ttl_seconds
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not os.path.isdir(path) or not _SAFE_ID.match(name):
+                continue
+            history = os.path.join(path, "history.jsonl")
+            last_write = max(os.path.getmtime(path), os.path.getmtime(history) if os.path.exists(history) else 0)
+            if last_write < cutoff:
+                self.drop_session(name)
@@ -1,30 +1,199 @@
-from faster_whisper import WhisperModel
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 import io
+from utils.tracing import tracer
+
+# Decoding options per latency profile: greedy decoding finishes a segment
+# almost as soon as speech stops, beam search trades latency for accuracy.
+LATENCY_PROFILES: Dict[str, Dict] = {
+    "fast": {"beam_size": 1, "best_of": 1, "temperature": 0.0, "condition_on_previous_text": False},
+    "accurate": {"beam_size": 5},
+}
 
 class STTEngine:
-    def __init__(self, model_size: str = "tiny", device: str = "cpu", compute_type: str = "int8"):
+    def __init__(self, model_size: str = "tiny", device: str = "cpu", compute_type: str = "int8",
+                 latency_profile: str = "fast", cpu_threads: int = 0):
         """
         Initializes the Faster Whisper model.
         Args:
             model_size: 'tiny', 'base', 'small', 'medium', 'large-v2'
             device: 'cpu' or 'cuda' (if GPU available)
             compute_type: 'int8', 'float16', 'float32'
+            latency_profile: 'fast' (greedy) or 'accurate' (beam search)
+            cpu_threads: Threads used by this model on CPU (0 = library default)
         """
+        if latency_profile not in LATENCY_PROFILES:
+            raise ValueError(f"Unknown latency profile: {latency_profile}")
+        self.latency_profile = latency_profile
         print(f"Loading Faster Whisper model: {model_size} on {device}...")
-        self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
+        from faster_whisper import WhisperModel
+        self.model = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
         print("Faster Whisper model loaded.")
 
-    def transcribe(self, audio_bytes: bytes) -> str:
+    def _decode(self, audio, latency_profile: Optional[str] = None, **options) -> Tuple[str, float]:
+        profile = LATENCY_PROFILES[latency_profile or self.latency_profile]
+        segments, info = self.model.transcribe(audio, **profile, **options)
+        text = " ".join(segment.text.strip() for segment in segments).strip()
+        return text, getattr(info, "duration", 0.0)
+
+    def transcribe(self, audio_bytes: bytes, latency_profile: Optional[str] = None) -> str:
         """
         Transcribes audio bytes to text.
         """
+        return self.transcribe_with_info(audio_bytes, latency_profile)[0]
+
+    def transcribe_with_info(self, audio_bytes: bytes, latency_profile: Optional[str] = None) -> Tuple[str, float]:
+        """
+        Transcribes audio bytes and also returns the audio duration in seconds.
+        """
         # faster-whisper accepts a file-like object
         audio_file = io.BytesIO(audio_bytes)
-        
-        segments, info = self.model.transcribe(audio_file, beam_size=5)
-        
-        text = ""
-        for segment in segments:
-            text += segment.text + " "
-            
-        return text.strip()
+
+        with tracer.span("stt.transcribe", audio_bytes=len(audio_bytes),
+                         profile=latency_profile or self.latency_profile) as span:
+            # Skip leading/trailing silence with the built-in VAD
+            text, duration = self._decode(audio_file, latency_profile, vad_filter=True)
+            span.set(audio_seconds=duration, text_chars=len(text))
+            return text, duration
+
+    def transcribe_samples(self, samples: np.ndarray, latency_profile: Optional[str] = None) -> str:
+        """
+        Transcribes 16 kHz mono float32 samples.
+        """
+        with tracer.span("stt.transcribe_samples", audio_seconds=len(samples) / 16000,
+                         profile=latency_profile or self.latency_profile):
+            return self._decode(samples, latency_profile)[0]
+
+    def stream(self, **kwargs) -> "StreamingTranscriber":
+        """
+        Starts an incremental transcription session; see StreamingTranscriber.
+        """
+        return StreamingTranscriber(self, **kwargs)
+
+@dataclass
+class TranscriptEvent:
+    kind: str  # "partial" or "final"
+    text: str
+    start: float  # seconds from the start of the stream
+    end: float
+
+class StreamingTranscriber:
+    """
+    Incremental transcription of a live 16 kHz mono 16-bit PCM stream.
+
+    Audio is fed in arbitrary-sized pieces. An energy-based voice-activity
+    detector cuts the stream into speech segments: while a segment is open,
+    a greedy "partial" transcript is emitted every partial_interval_ms of new
+    speech, and once silence_ms of silence follows it the segment is decoded
+    with the engine's latency profile and emitted as "final".
+
+    Decoding runs synchronously inside feed(). A partial re-decodes the open
+    segment, so it only covers the last partial_window_s seconds of it; each
+    partial then costs at most that much audio instead of growing with the
+    segment up to max_segment_s. engine is anything with transcribe_samples,
+    e.g. an STTEngine or a utils.stt_service.TranscriptionService.
+    """
+    SAMPLE_RATE = 16000
+
+    def __init__(self, engine: STTEngine, frame_ms: int = 30, energy_threshold: float = 0.01,
+                 silence_ms: int = 500, min_speech_ms: int = 250, partial_interval_ms: int = 1000,
+                 partial_window_s: float = 10.0, max_segment_s: float = 30.0,
+                 latency_profile: Optional[str] = None):
+        self.engine = engine
+        self.latency_profile = latency_profile
+        self.energy_threshold = energy_threshold
+        self.frame_len = self.SAMPLE_RATE * frame_ms // 1000
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.min_speech_samples = self.SAMPLE_RATE * min_speech_ms // 1000
+        self.partial_samples = self.SAMPLE_RATE * partial_interval_ms // 1000
+        self.partial_window_samples = int(self.SAMPLE_RATE * partial_window_s)
+        self.max_segment_samples = int(self.SAMPLE_RATE * max_segment_s)
+
+        self._pending = b""  # bytes not yet forming a whole frame
+        self._position = 0  # samples consumed so far
+        self._segment: List[np.ndarray] = []
+        self._segment_start = 0
+        self._segment_len = 0
+        self._since_partial = 0
+        self._silent_run = 0
+        self._previous_frame: Optional[np.ndarray] = None
+
+    def feed(self, pcm: bytes) -> List[TranscriptEvent]:
+        """
+        Adds little-endian int16 PCM audio and returns any transcripts it completed.
+        """
+        data = self._pending + pcm
+        frame_bytes = self.frame_len * 2
+        usable = len(data) - len(data) % frame_bytes
+        self._pending = data[usable:]
+
+        events = []
+        samples = np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+        for offset in range(0, len(samples), self.frame_len):
+            event = self._process_frame(samples[offset:offset + self.frame_len])
+            if event:
+                events.append(event)
+        return events
+
+    def finish(self) -> List[TranscriptEvent]:
+        """
+        Flushes the stream and returns the final transcript of any open segment.
+        """
+        event = self._close_segment()
+        return [event] if event else []
+
+    def _process_frame(self, frame: np.ndarray) -> Optional[TranscriptEvent]:
+        is_speech = float(np.sqrt(np.mean(frame * frame))) >= self.energy_threshold
+        self._position += len(frame)
+
+        if not self._segment:
+            if is_speech:
+                # Keep one frame of pre-roll so the first phoneme isn't clipped
+                pre_roll = [self._previous_frame] if self._previous_frame is not None else []
+                self._segment = pre_roll + [frame]
+                self._segment_len = sum(len(f) for f in self._segment)
+                self._segment_start = self._position - self._segment_len
+                self._since_partial = len(frame)
+                self._silent_run = 0
+            self._previous_frame = frame
+            return None
+
+        self._segment.append(frame)
+        self._segment_len += len(frame)
+        self._since_partial += len(frame)
+        self._silent_run = 0 if is_speech else self._silent_run + 1
+
+        if self._silent_run >= self.silence_frames or self._segment_len >= self.max_segment_samples:
+            return self._close_segment()
+        if self._since_partial >= self.partial_samples:
+            self._since_partial = 0
+            window = np.concatenate(self._segment)[-self.partial_window_samples:]
+            try:
+                text = self.engine.transcribe_samples(window, "fast")
+            except Exception as e:
+                # Partials are best effort (e.g. a busy worker pool); the final still decodes the segment
+                print(f"Partial transcription skipped: {e}")
+                return None
+            if text:
+                return TranscriptEvent("partial", text, (self._position - len(window)) / self.SAMPLE_RATE,
+                                       self._position / self.SAMPLE_RATE)
+        return None
+
+    def _close_segment(self) -> Optional[TranscriptEvent]:
+        if not self._segment:
+            return None
+        audio = np.concatenate(self._segment)
+        start = self._segment_start / self.SAMPLE_RATE
+        speech_len = self._segment_len - self._silent_run * self.frame_len
+        self._segment = []
+        self._segment_len = 0
+        self._silent_run = 0
+        self._previous_frame = None
+        # Drop clicks and pops too short to be words
+        if speech_len < self.min_speech_samples:
+            return None
+        text = self.engine.transcribe_samples(audio, self.latency_profile)
+        if not text:
+            return None
+        return TranscriptEvent("final", text, start, start + len(audio) / self.SAMPLE_RATE)
@@ -0,0 +1,212 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Union
+
+import numpy as np
+
+from utils.stt import STTEngine, StreamingTranscriber
+from utils.tracing import tracer
+
+class ServiceOverloaded(RuntimeError):
+    """
+    Raised when the transcription queue is full.
+    """
+
+@dataclass
+class TranscriptionResult:
+    text: str
+    queue_wait: float  # seconds spent waiting for a free worker
+    processing_time: float  # seconds spent in the model
+    audio_duration: float
+    real_time_factor: float  # processing_time / audio_duration; below 1 is faster than real time
+    latency_profile: str
+
+class TranscriptionService:
+    """
+    Pool of Whisper workers behind a bounded request queue.
+
+    Each worker thread owns its own STTEngine with cpu_threads pinned, so
+    concurrent sessions don't contend on one shared model. When the queue is
+    full submit() raises ServiceOverloaded; once it is at least degrade_at
+    deep, new requests are decoded with the greedy 'fast' profile.
+    """
+    def __init__(self, num_workers: int = 2, cpu_threads: int = 0, max_queue: int = 8,
+                 degrade_at: Optional[int] = None, model_size: str = "tiny", device: str = "cpu",
+                 compute_type: str = "int8", latency_profile: str = "fast",
+                 engine_factory: Callable[..., STTEngine] = STTEngine):
+        """
+        Args:
+            num_workers: Model instances transcribing in parallel.
+            cpu_threads: Threads per model; 0 splits the cores evenly between workers.
+            max_queue: Requests allowed to wait before new ones are rejected.
+            degrade_at: Queue depth from which requests use the 'fast' profile
+                (defaults to half of max_queue).
+            engine_factory: Builds each worker's engine from the STTEngine
+                keyword arguments (e.g. a stand-in for tests).
+        """
+        self.num_workers = num_workers
+        self.cpu_threads = cpu_threads or max(1, (os.cpu_count() or 1) // num_workers)
+        self.max_queue = max_queue
+        self.degrade_at = degrade_at if degrade_at is not None else max(1, max_queue // 2)
+        self.latency_profile = latency_profile
+        self._engine_factory = engine_factory
+        self._engine_kwargs = {"model_size": model_size, "device": device, "compute_type": compute_type,
+                               "latency_profile": latency_profile, "cpu_threads": self.cpu_threads}
+
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._recent = deque(maxlen=100)
+        self._ready_workers = 0
+        self._model_load_seconds = []
+        self._failed_workers = 0
+        self._load_error: Optional[str] = None
+        self._lock = threading.Lock()
+        # Models load inside the worker threads, so construction doesn't block
+        self._workers = [
+            threading.Thread(target=self._run_worker, name=f"stt-worker-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, audio: Union[bytes, np.ndarray], latency_profile: Optional[str] = None) -> Future:
+        """
+        Queues a clip (encoded audio bytes, or 16 kHz mono float32 samples)
+        for transcription and returns a Future of TranscriptionResult.
+        """
+        profile = latency_profile or self.latency_profile
+        if self._queue.qsize() >= self.degrade_at:
+            profile = "fast"
+        future: Future = Future()
+        # Under the lock so a request can't slip in after the last worker failed and drained the queue
+        with self._lock:
+            if self.failed:
+                raise RuntimeError(self._load_error)
+            try:
+                self._queue.put_nowait((audio, profile, future, time.monotonic()))
+            except queue.Full:
+                raise ServiceOverloaded(f"Transcription queue is full ({self.max_queue} waiting)")
+        return future
+
+    @property
+    def failed(self) -> bool:
+        """
+        True once every worker failed to load its model; the service then
+        rejects requests and should be replaced (LazyComponent rebuilds it).
+        """
+        return self._failed_workers == self.num_workers
+
+    def transcribe(self, audio: Union[bytes, np.ndarray], latency_profile: Optional[str] = None,
+                   timeout: Optional[float] = None) -> TranscriptionResult:
+        """
+        Blocking helper: submits a clip and waits for its result. On timeout
+        the request is cancelled, so no worker spends time on it later.
+        """
+        future = self.submit(audio, latency_profile)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise
+
+    def transcribe_samples(self, samples: np.ndarray, latency_profile: Optional[str] = None,
+                           timeout: Optional[float] = 60) -> str:
+        """
+        Transcribes 16 kHz mono float32 samples on the pool (the STTEngine
+        method of the same name), so StreamingTranscriber can run on it.
+        """
+        return self.transcribe(samples, latency_profile, timeout).text
+
+    def stream(self, **kwargs) -> StreamingTranscriber:
+        """
+        Starts an incremental transcription session whose decodes queue on
+        this pool like any other request; see StreamingTranscriber.
+        """
+        return StreamingTranscriber(self, **kwargs)
+
+    def _run_worker(self):
+        started = time.monotonic()
+        try:
+            engine = self._engine_factory(**self._engine_kwargs)
+        except Exception as e:
+            print(f"STT worker failed to load model: {e}")
+            with self._lock:
+                self._failed_workers += 1
+                if self.failed:
+                    self._load_error = f"No speech-to-text worker could load its model: {e}"
+                    self._fail_pending(RuntimeError(self._load_error))
+            return
+        with self._lock:
+            self._ready_workers += 1
+            self._model_load_seconds.append(time.monotonic() - started)
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            audio, profile, future, enqueued_at = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            started = time.monotonic()
+            try:
+                if isinstance(audio, np.ndarray):
+                    text = engine.transcribe_samples(audio, profile)
+                    duration = len(audio) / StreamingTranscriber.SAMPLE_RATE
+                else:
+                    text, duration = engine.transcribe_with_info(audio, profile)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            processing = time.monotonic() - started
+            result = TranscriptionResult(
+                text=text,
+                queue_wait=started - enqueued_at,
+                processing_time=processing,
+                audio_duration=duration,
+                real_time_factor=processing / duration if duration else 0.0,
+                latency_profile=profile,
+            )
+            self._recent.append(result)
+            tracer.record("stt.queue_wait", result.queue_wait, profile=profile)
+            print(f"STT: {duration:.1f}s audio, waited {result.queue_wait:.2f}s, RTF {result.real_time_factor:.2f} ({profile})")
+            future.set_result(result)
+
+    def _fail_pending(self, error: Exception):
+        # No worker is left to serve the queue: fail everything still waiting
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[2].set_running_or_notify_cancel():
+                item[2].set_exception(error)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Pool status plus averages over the last 100 requests.
+        """
+        recent = list(self._recent)
+        n = len(recent)
+        return {
+            "workers": self.num_workers,
+            "ready_workers": self._ready_workers,
+            "model_load_seconds": max(self._model_load_seconds, default=None),
+            "cpu_threads_per_worker": self.cpu_threads,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self.max_queue,
+            "avg_queue_wait": sum(r.queue_wait for r in recent) / n if n else 0.0,
+            "avg_real_time_factor": sum(r.real_time_factor for r in recent) / n if n else 0.0,
+        }
+
+    def shutdown(self):
+        """
+        Stops the workers once the requests already queued are done.
+        """
+        for _ in self._workers:
+            self._queue.put(None)
+        for worker in self._workers:
+            worker.join()
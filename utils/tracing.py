@@ -0,0 +1,227 @@
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+# Upper bounds (seconds) of the cumulative histogram buckets in the Prometheus export
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("trace_id", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("span_name", default=None)
+
+def _quantile(ordered: List[float], q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def last_trace_of(spans: List[Dict[str, Any]], root: str) -> List[Dict[str, Any]]:
+    """
+    Spans of the most recent trace in spans (e.g. a snapshot's recent_spans)
+    whose root span is named root.
+    """
+    for span in reversed(spans):
+        if span["name"] == root and span["parent"] is None:
+            return [s for s in spans if s["trace_id"] == span["trace_id"]]
+    return []
+
+class _Stage:
+    """
+    Aggregates for one span name: totals, cumulative buckets and a window
+    of recent durations for percentiles.
+    """
+    def __init__(self, window: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+        self.recent = deque(maxlen=window)
+
+    def add(self, seconds: float, error: bool):
+        self.count += 1
+        self.errors += error
+        self.total += seconds
+        self.recent.append(seconds)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+class Span:
+    """
+    A timed section. Use as a context manager; set() attaches attributes
+    such as sizes. An exception escaping the block marks the span as failed.
+    """
+    def __init__(self, tracer: "Tracer", name: str, attrs: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.trace_id = None
+        self.parent = None
+        self._tokens = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self.trace_id = _current_trace.get()
+        new_trace = self.trace_id is None
+        if new_trace:
+            self.trace_id = uuid.uuid4().hex[:16]
+        self.parent = _current_span.get()
+        self._tokens = (_current_trace.set(self.trace_id) if new_trace else None, _current_span.set(self.name))
+        self.started = time.perf_counter()
+        self.start_time = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        trace_token, span_token = self._tokens
+        _current_span.reset(span_token)
+        if trace_token is not None:
+            _current_trace.reset(trace_token)
+        if exc_type is not None and exc_type is not GeneratorExit:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._finish(self.name, duration, self.attrs, self.trace_id, self.parent, self.start_time)
+        return False
+
+class Tracer:
+    """
+    In-process span collector.
+
+    Spans are aggregated per name into counts, error counts, cumulative
+    latency buckets and p50/p95/p99 over the last `window` samples, and
+    the most recent spans are kept for inspecting single turns. Spans
+    opened inside another span share its trace id (contextvars, so this
+    follows asyncio tasks but not executor threads).
+    """
+    def __init__(self, window: int = 1000, recent_spans: int = 500):
+        self.window = window
+        self._stages: Dict[str, _Stage] = {}
+        self._recent = deque(maxlen=recent_spans)
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **attrs) -> Span:
+        return Span(self, name, attrs)
+
+    def record(self, name: str, seconds: float, **attrs):
+        """
+        Records an already measured duration as a span, e.g. time summed over
+        many small steps or measured in another thread.
+        """
+        self._finish(name, seconds, attrs, _current_trace.get(), _current_span.get(), time.time() - seconds)
+
+    def _finish(self, name, duration, attrs, trace_id, parent, start_time):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = _Stage(self.window)
+            stage.add(duration, "error" in attrs)
+            self._recent.append({
+                "name": name,
+                "trace_id": trace_id,
+                "parent": parent,
+                "start": start_time,
+                "duration": duration,
+                "attrs": dict(attrs),
+            })
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Per-span-name count, errors, mean and windowed p50/p95/p99 (seconds).
+        """
+        with self._lock:
+            stages = {name: (s.count, s.errors, s.total, sorted(s.recent)) for name, s in self._stages.items()}
+        return {
+            name: {
+                "count": count,
+                "errors": errors,
+                "mean": total / count if count else None,
+                "p50": _quantile(recent, 0.50),
+                "p95": _quantile(recent, 0.95),
+                "p99": _quantile(recent, 0.99),
+            }
+            for name, (count, errors, total, recent) in sorted(stages.items())
+        }
+
+    def recent_spans(self, trace_id: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self._recent)
+        if trace_id is not None:
+            spans = [s for s in spans if s["trace_id"] == trace_id]
+        return spans[-limit:]
+
+    def last_trace(self, root: str) -> List[Dict[str, Any]]:
+        """
+        Spans of the most recent trace whose root span is named root.
+        """
+        return last_trace_of(self.recent_spans(limit=self._recent.maxlen), root)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"generated_at": time.time(), "stages": self.stats(), "recent_spans": self.recent_spans()}
+
+    def export_json(self, path: str):
+        """
+        Writes snapshot() to path atomically.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2, default=str)
+        os.replace(tmp_path, path)
+
+    def to_prometheus(self) -> str:
+        """
+        Prometheus text exposition: one span_duration_seconds histogram per span name.
+        """
+        with self._lock:
+            stages = {name: (s.count, s.errors, s.total, list(s.buckets)) for name, s in self._stages.items()}
+        lines = [
+            "# HELP span_duration_seconds Duration of traced stages.",
+            "# TYPE span_duration_seconds histogram",
+        ]
+        for name, (count, errors, total, buckets) in sorted(stages.items()):
+            for bound, n in zip(BUCKETS, buckets):
+                lines.append(f'span_duration_seconds_bucket{{span="{name}",le="{bound}"}} {n}')
+            lines.append(f'span_duration_seconds_bucket{{span="{name}",le="+Inf"}} {count}')
+            lines.append(f'span_duration_seconds_sum{{span="{name}"}} {total}')
+            lines.append(f'span_duration_seconds_count{{span="{name}"}} {count}')
+        lines.append("# HELP span_errors_total Traced stages that raised.")
+        lines.append("# TYPE span_errors_total counter")
+        for name, (_, errors, _, _) in sorted(stages.items()):
+            lines.append(f'span_errors_total{{span="{name}"}} {errors}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+        """
+        Serves /metrics (Prometheus) and /metrics.json from a daemon thread.
+        """
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = tracer.to_prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(tracer.snapshot(), default=str).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+        return server
+
+# Process-wide tracer used by the instrumented components
+tracer = Tracer()